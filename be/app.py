@@ -1,20 +1,42 @@
 # app.py
-from flask import Flask
-from flask_cors import CORS
-from database.set_up import initialize_db
-from routes.user_route import user_routes
-from routes.image_route import image_routes
-from routes.admin_route import admin_routes
-from routes.image_caption_route import image_caption_routes
-from routes.auth_route import auth_routes
-from flask_jwt_extended import JWTManager
-import datetime
-import os
 from dotenv import load_dotenv
 
+# Cấu hình của các service được đọc khi import nên phải nạp .env trước
 load_dotenv()
 
+from flask import Flask, Request, jsonify, request  # noqa: E402
+from flask_cors import CORS  # noqa: E402
+from database.set_up import initialize_db  # noqa: E402
+from routes.user_route import user_routes  # noqa: E402
+from routes.image_route import image_routes  # noqa: E402
+from routes.admin_route import admin_routes  # noqa: E402
+from routes.image_caption_route import image_caption_routes  # noqa: E402
+from routes.auth_route import auth_routes  # noqa: E402
+from services.caption_job_service import CaptionJobService  # noqa: E402
+from services.image_caption_service import ImageCaptionService  # noqa: E402
+from services.image_service import ImageService  # noqa: E402
+from services.stats_service import StatsService  # noqa: E402
+from services.bulk_caption_service import BulkCaptionService  # noqa: E402
+from flask_jwt_extended import JWTManager  # noqa: E402
+import datetime  # noqa: E402
+import os  # noqa: E402
+
+# Endpoint tải lên nhiều ảnh có giới hạn kích thước request riêng (BULK_MAX_MB)
+BULK_ENDPOINT = "image_caption_routes.bulk_caption"
+
+
+class UploadRequest(Request):
+    """Giới hạn MAX_CONTENT_LENGTH theo endpoint (URL đã được khớp trước khi body được đọc)"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == BULK_ENDPOINT:
+            return BulkCaptionService.MAX_REQUEST_SIZE
+        return super().max_content_length
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE"], "allow_headers": ["Content-Type", "Authorization"]}})
 
@@ -22,10 +44,18 @@ CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "
 app.config["MONGODB_SETTINGS"] = {"host": os.getenv("MONGODB_URI")}
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = datetime.timedelta(days=1)
+# Từ chối sớm request có Content-Length vượt quá giới hạn, trước khi Werkzeug đọc body
+app.config["MAX_CONTENT_LENGTH"] = ImageService.MAX_UPLOAD_SIZE + 64 * 1024  # cộng phần header multipart
 
 # Khởi tạo JWT
 jwt = JWTManager(app)
 
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    if request.endpoint == BULK_ENDPOINT:
+        return jsonify({"error": f"Request vượt quá kích thước tối đa {BulkCaptionService.MAX_REQUEST_SIZE // (1024 * 1024)}MB"}), 413
+    return jsonify({"error": f"File vượt quá kích thước tối đa {ImageService.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"}), 413
+
 # Khởi tạo cơ sở dữ liệu
 initialize_db(app)
 
@@ -36,5 +66,15 @@ app.register_blueprint(image_routes, url_prefix="/api/images")
 app.register_blueprint(admin_routes, url_prefix="/api/admin")
 app.register_blueprint(image_caption_routes, url_prefix="/api/image-caption")
 
+# Khởi động các caption worker xử lý job bất đồng bộ
+CaptionJobService.start_workers()
+
+# Đối soát định kỳ bộ đếm thống kê lưu sẵn (chỉ khi bật STATS_MATERIALIZED)
+StatsService.start_reconciler()
+
+# Tải sẵn mô hình và chạy suy luận giả (tùy chọn) để request đầu tiên không phải chờ
+if os.getenv("CAPTION_WARMUP", "false").lower() == "true":
+    ImageCaptionService.start_warm_up()
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,142 @@
+# benchmarks/bench_caption_search.py
+"""
+So sánh thông lượng tìm kiếm caption: chỉ mục text của MongoDB ($text, xếp theo textScore)
+và chỉ mục ngược trong tiến trình (CaptionSearchIndex, CAPTION_SEARCH_INDEX=memory).
+
+Chạy với một mongod cục bộ (dữ liệu được seed vào database riêng và xóa sau khi chạy):
+    python benchmarks/bench_caption_search.py --images 500000 --threads 8 --seconds 10
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from pymongo import MongoClient  # noqa: E402
+from services.caption_search_index import CaptionSearchIndex  # noqa: E402
+from services.text_search import text_query  # noqa: E402
+
+SUBJECTS = [("a dog", "một con chó"), ("a cat", "một con mèo"), ("a man", "một người đàn ông"),
+            ("a woman", "một người phụ nữ"), ("two children", "hai đứa trẻ"), ("a red car", "một chiếc xe đỏ"),
+            ("a bird", "một con chim"), ("a group of people", "một nhóm người")]
+ACTIONS = [("sitting on", "đang ngồi trên"), ("standing next to", "đang đứng cạnh"), ("running on", "đang chạy trên"),
+           ("lying on", "đang nằm trên"), ("looking at", "đang nhìn")]
+PLACES = [("a couch", "ghế sofa"), ("the beach", "bãi biển"), ("a street", "đường phố"), ("a table", "cái bàn"),
+          ("the grass", "bãi cỏ"), ("a snowy mountain", "ngọn núi tuyết"), ("a wooden bridge", "cây cầu gỗ")]
+# "do"/"đỏ": chỉ mục trong bộ nhớ chuyển đ -> d, $text của MongoDB thì không (xem README)
+QUERIES = ["dog", "red car beach", "mèo", "bãi biển", "bai bien", "snowy mountain bridge", "người phụ nữ", "zebra",
+           "xe đỏ", "xe do"]
+
+
+def seed(collection, count):
+    collection.drop()
+    rng = random.Random(42)
+    started = datetime.datetime(2024, 1, 1)
+    batch = []
+    for i in range(count):
+        subject, action, place = rng.choice(SUBJECTS), rng.choice(ACTIONS), rng.choice(PLACES)
+        batch.append({
+            'description': f"{subject[0]} {action[0]} {place[0]}",
+            'caption_vi': f"{subject[1]} {action[1]} {place[1]}",
+            'created_at': started + datetime.timedelta(seconds=i)
+        })
+        if len(batch) == 10_000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+            print(f"  {i + 1} images", end="\r")
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    print()
+    collection.create_index(
+        [('description', 'text'), ('caption_vi', 'text')],
+        default_language='none', weights={'description': 2, 'caption_vi': 1}, name='caption_text'
+    )
+
+
+def mongo_search(collection, per_page):
+    def run(query):
+        return list(
+            collection.find(
+                {'$text': {'$search': text_query(query)}},
+                {'description': 1, 'created_at': 1, 'uploaded_by': 1, 'score': {'$meta': 'textScore'}}
+            )
+            .sort([('score', {'$meta': 'textScore'}), ('created_at', -1)])
+            .limit(per_page + 1)
+        )
+    return run
+
+
+def memory_search(index, collection, per_page):
+    """Như ImageService.search_images với CAPTION_SEARCH_INDEX=memory: xếp hạng trong bộ nhớ rồi đọc lại từ MongoDB"""
+    projection = {'description': 1, 'created_at': 1, 'uploaded_by': 1}
+
+    def run(query):
+        ranked = index.search(query, 0, per_page + 1)
+        docs = {doc['_id']: doc for doc in collection.find({'_id': {'$in': [i for i, _ in ranked]}}, projection)}
+        return [docs[image_id] for image_id, _ in ranked[:per_page] if image_id in docs]
+    return run
+
+
+def throughput(search, threads, seconds):
+    """Chạy search liên tục trên nhiều luồng, trả về (truy vấn/giây, độ trễ trung vị ms)"""
+    deadline = time.perf_counter() + seconds
+    timings = [[] for _ in range(threads)]
+
+    def worker(timing):
+        i = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            search(QUERIES[i % len(QUERIES)])
+            timing.append(time.perf_counter() - started)
+            i += 1
+
+    workers = [threading.Thread(target=worker, args=(timing,)) for timing in timings]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    samples = [sample for timing in timings for sample in timing]
+    return len(samples) / seconds, statistics.median(samples) * 1000 if samples else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='airc_bench')
+    parser.add_argument('--images', type=int, default=500_000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, maxPoolSize=args.threads * 2)
+    collection = client[args.database]['images']
+    try:
+        print(f"Seeding {args.images} images...")
+        seed(collection, args.images)
+
+        started = time.perf_counter()
+        index = CaptionSearchIndex.from_collection(collection)
+        print(f"Dựng chỉ mục trong bộ nhớ: {len(index)} ảnh trong {time.perf_counter() - started:.2f}s")
+
+        print(f"{'query':<24} {'mongo hits':>10} {'memory hits':>12}")
+        for query in QUERIES:
+            mongo_hits = collection.count_documents({'$text': {'$search': text_query(query)}})
+            memory_hits = len(index.search(query, 0, args.images))
+            print(f"{query:<24} {mongo_hits:>10} {memory_hits:>12}")
+
+        for name, search in (("mongo $text", mongo_search(collection, args.per_page)),
+                             ("memory index", memory_search(index, collection, args.per_page))):
+            qps, median = throughput(search, args.threads, args.seconds)
+            print(f"{name:<14} {qps:>10.1f} truy vấn/s | trung vị {median:.2f} ms ({args.threads} luồng)")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_image_listing.py
+"""
+So sánh truy vấn danh sách ảnh: tải document đầy đủ (có image_data) và truy vấn chỉ lấy các trường cần thiết.
+
+Chạy với một mongod cục bộ (dữ liệu được seed vào database riêng và xóa sau khi chạy):
+    python benchmarks/bench_image_listing.py --images 500 --image-size 300000 --per-page 20
+"""
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+
+LISTING_PROJECTION = {'description': 1, 'created_at': 1, 'uploaded_by': 1}
+
+
+def seed(collection, count, image_size):
+    """Seed ảnh theo cấu trúc cũ (image_data nằm trong document)"""
+    collection.drop()
+    owner = ObjectId()
+    now = datetime.datetime.now()
+    payload = os.urandom(image_size)
+    batch = []
+    for i in range(count):
+        batch.append({
+            'description': f"a photo number {i}",
+            'file_name': f"image_{i}.jpg",
+            'content_type': 'image/jpeg',
+            'image_data': payload,
+            'uploaded_by': owner,
+            'created_at': now - datetime.timedelta(seconds=i)
+        })
+        if len(batch) == 50:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    collection.create_index([('created_at', -1)])
+
+
+def measure(collection, projection, pages, per_page, repeat):
+    raw = collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+    timings = []
+    transferred = 0
+    for _ in range(repeat):
+        for page in range(1, pages + 1):
+            started = time.perf_counter()
+            docs = list(raw.find({}, projection).sort('created_at', -1).skip((page - 1) * per_page).limit(per_page))
+            timings.append(time.perf_counter() - started)
+            transferred += sum(len(doc.raw) for doc in docs)
+    requests = repeat * pages
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': sorted(timings)[int(len(timings) * 0.95) - 1] * 1000,
+        'bytes_per_page': transferred / requests
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='airc_bench')
+    parser.add_argument('--images', type=int, default=500)
+    parser.add_argument('--image-size', type=int, default=300_000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    collection = client[args.database]['images']
+    try:
+        print(f"Seeding {args.images} images of {args.image_size} bytes...")
+        seed(collection, args.images, args.image_size)
+
+        for name, projection in (('full documents', None), ('projection', LISTING_PROJECTION)):
+            result = measure(collection, projection, args.pages, args.per_page, args.repeat)
+            print(f"{name:>15}: median {result['median_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+                  f"{result['bytes_per_page'] / 1024:.1f} KiB/page")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_user_search.py
+"""
+So sánh tìm kiếm người dùng: regex không neo, không phân biệt hoa thường trên username/email/full_name (cách cũ)
+và aggregation của UserService.search_users (tiền tố trên search_keys có chỉ mục, chấm điểm và sắp xếp).
+
+Chạy với một mongod cục bộ (dữ liệu được seed vào database riêng và xóa sau khi chạy):
+    python benchmarks/bench_user_search.py --users 1000000 --repeat 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from pymongo import MongoClient  # noqa: E402
+from services.text_search import build_user_search_keys, normalize  # noqa: E402
+from services.user_service import UserService  # noqa: E402
+
+FIRST_NAMES = ["Hoàn", "Minh", "Lan", "Hương", "Tuấn", "Anh", "Dũng", "Thảo", "Quang", "Linh", "Hải", "Trang"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Đức", "Ngọc", "Thanh", "Minh", "Quốc"]
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Đoàn", "Vũ", "Đặng", "Bùi", "Đỗ"]
+QUERIES = ["n", "nguyen", "hoan", "nguyen van", "Đoàn Hữu", "minh123", "lan4", "trang@", "tuan99", "xyzabc"]
+
+
+def seed(collection, count):
+    collection.drop()
+    rng = random.Random(42)
+    batch = []
+    for i in range(count):
+        first, middle, last = rng.choice(FIRST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(LAST_NAMES)
+        username = f"{normalize(first)}{i}"
+        email = f"{username}@example.com"
+        full_name = f"{last} {middle} {first}"
+        batch.append({
+            'username': username,
+            'email': email,
+            'full_name': full_name,
+            'is_active': True,
+            'role': 'user',
+            'search_keys': build_user_search_keys(username, email, full_name)
+        })
+        if len(batch) == 10_000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+            print(f"  {i + 1} users", end="\r")
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    print()
+    collection.create_index('search_keys')
+    collection.create_index('username', unique=True)
+
+
+def regex_filter(query):
+    """Truy vấn cũ: regex không neo, không escape"""
+    return {"$or": [
+        {"username": {"$regex": query, "$options": "i"}},
+        {"email": {"$regex": query, "$options": "i"}},
+        {"full_name": {"$regex": query, "$options": "i"}}
+    ]}
+
+
+def measure_regex(collection, query, per_page, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(collection.find(regex_filter(query), {'password': 0}).limit(per_page))
+        timings.append(time.perf_counter() - started)
+    stats = collection.find(regex_filter(query)).limit(per_page).explain()['executionStats']
+    return statistics.median(timings) * 1000, max(timings) * 1000, stats['totalDocsExamined']
+
+
+def measure_search(collection, query, per_page, repeat):
+    """Chạy đúng các truy vấn của UserService.search_users (trang đầu), trả về cả số ứng viên được chấm điểm"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        candidate_ids = UserService.search_candidates(collection, query)
+        list(collection.aggregate(UserService.search_pipeline(query, candidate_ids, 1, per_page)))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, max(timings) * 1000, len(candidate_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=os.getenv('BENCH_MONGODB_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='airc_bench')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    collection = client[args.database]['users']
+    try:
+        print(f"Seeding {args.users} users...")
+        seed(collection, args.users)
+
+        print(f"{'query':<14} {'regex median':>13} {'max':>9} {'examined':>10} "
+              f"{'search median':>14} {'max':>9} {'ranked':>10}")
+        for query in QUERIES:
+            old = measure_regex(collection, query, args.per_page, args.repeat)
+            new = measure_search(collection, query, args.per_page, args.repeat)
+            print(f"{query:<14} {old[0]:>10.2f} ms {old[1]:>6.2f} ms {old[2]:>10} "
+                  f"{new[0]:>11.2f} ms {new[1]:>6.2f} ms {new[2]:>10}")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/compare_inference_modes.py
+"""
+So sánh độ trễ và độ chính xác của các chế độ suy luận BLIP (fp32, int8, onnx, onnx-int8)
+trên một tập ảnh cố định. Caption của fp32 được dùng làm chuẩn tham chiếu.
+
+Chạy từ thư mục be:
+    python benchmarks/compare_inference_modes.py --images-dir ../uploads/images --modes fp32,int8,onnx,onnx-int8
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image  # noqa: E402
+from services.image_caption_service import ImageCaptionService  # noqa: E402
+
+DEFAULT_IMAGES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploads", "images"))
+
+
+def load_images(images_dir, limit):
+    paths = sorted(
+        path for pattern in ("*.jpg", "*.jpeg", "*.png")
+        for path in glob.glob(os.path.join(images_dir, pattern))
+    )[:limit]
+    if not paths:
+        raise SystemExit(f"Không tìm thấy ảnh trong {images_dir}")
+    return paths, [Image.open(path).convert("RGB") for path in paths]
+
+
+def token_f1(candidate, reference):
+    """F1 theo token giữa caption của chế độ tối ưu và caption fp32"""
+    cand, ref = candidate.lower().split(), reference.lower().split()
+    if not cand or not ref:
+        return float(cand == ref)
+    common = sum(min(cand.count(t), ref.count(t)) for t in set(cand))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(cand), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_mode(mode, images, params, repeat):
+    ImageCaptionService.unload_model()
+    ImageCaptionService._inference_mode = mode
+    ImageCaptionService._model_revision = None
+
+    started = time.perf_counter()
+    ImageCaptionService._load_model_if_needed()
+    load_seconds = time.perf_counter() - started
+
+    # Warm-up trước khi đo
+    ImageCaptionService._generate_batch(images[:1], **params)
+
+    captions, latencies = [], []
+    for image in images:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            caption = ImageCaptionService._generate_batch([image], **params)[0]
+            timings.append(time.perf_counter() - started)
+        captions.append(caption)
+        latencies.append(statistics.median(timings))
+    return captions, latencies, load_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images-dir", default=DEFAULT_IMAGES_DIR)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--modes", default="fp32,int8,onnx,onnx-int8")
+    parser.add_argument("--max-length", type=int, default=30)
+    parser.add_argument("--num-beams", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    paths, images = load_images(args.images_dir, args.limit)
+    params = {"max_length": args.max_length, "num_beams": args.num_beams, "min_length": 5}
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    results = {}
+    for mode in modes:
+        print(f"Đang chạy chế độ {mode} trên {len(images)} ảnh...")
+        results[mode] = run_mode(mode, images, params, args.repeat)
+
+    reference = results["fp32"][0]
+    print()
+    print(f"{'mode':<10} {'load s':>8} {'median ms':>10} {'p95 ms':>8} {'speedup':>8} {'exact':>7} {'tokenF1':>8}")
+    base_median = statistics.median(results["fp32"][1])
+    for mode, (captions, latencies, load_seconds) in results.items():
+        median = statistics.median(latencies)
+        p95 = sorted(latencies)[max(0, int(len(latencies) * 0.95) - 1)]
+        exact = sum(c == r for c, r in zip(captions, reference)) / len(reference)
+        f1 = statistics.mean(token_f1(c, r) for c, r in zip(captions, reference))
+        print(f"{mode:<10} {load_seconds:>8.2f} {median * 1000:>10.1f} {p95 * 1000:>8.1f} "
+              f"{base_median / median:>7.2f}x {exact:>7.2%} {f1:>8.3f}")
+
+    print()
+    for i, path in enumerate(paths):
+        print(os.path.basename(path))
+        for mode, (captions, _, _) in results.items():
+            print(f"  {mode:<10} {captions[i]}")
+
+
+if __name__ == "__main__":
+    main()
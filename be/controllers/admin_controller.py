@@ -2,19 +2,19 @@
 from flask import request, jsonify
 from services.user_service import UserService
 from services.image_service import ImageService
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.image_caption_service import ImageCaptionService
+from services.identity_service import IdentityService
+from services.stats_service import StatsService
+from services.pagination import page_args, page_meta
+from flask_jwt_extended import jwt_required
 from models.user import User
-from models.image import Image
-from models.report import Report
 from functools import wraps
 
 def admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.objects(id=user_id).first()
-        
-        if not user or user.role != 'admin':
+        # Vai trò lấy từ JWT claims hoặc cache identity, không truy vấn MongoDB mỗi request
+        if not IdentityService.is_admin():
             return jsonify({'error': 'Yêu cầu quyền admin'}), 403
         
         return fn(*args, **kwargs)
@@ -23,18 +23,17 @@ def admin_required(fn):
 @jwt_required()
 @admin_required
 def get_all_users():
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
-    
     is_active = request.args.get('is_active')  # "true", "false", hoặc None
     role = request.args.get('role')           # "admin", "user", hoặc None
     
-    users = UserService.get_all_users(
-        page=page,
-        per_page=per_page,
-        is_active=is_active,
-        role=role
-    )
+    try:
+        users = UserService.get_all_users(
+            is_active=is_active,
+            role=role,
+            **page_args(request.args)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
         'users': [
@@ -48,11 +47,38 @@ def get_all_users():
                 'created_at': user.created_at.isoformat() if hasattr(user, 'created_at') and user.created_at else None,
                 'last_login': user.last_login.isoformat() if hasattr(user, 'last_login') and user.last_login else None
             }
-            for user in users.items
+            for user in users['items']
         ],
-        'total': users.total,
-        'pages': users.pages,
-        'page': users.page
+        **page_meta(users)
+    }), 200
+
+@jwt_required()
+@admin_required
+def search_users():
+    """Tìm người dùng theo username, email hoặc họ tên (q), xếp theo mức độ liên quan"""
+    query = request.args.get('q', '')
+    
+    try:
+        args = page_args(request.args)
+        users = UserService.search_users(query, page=args['page'], per_page=args['per_page'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'users': [
+            {
+                'id': str(user['_id']),
+                'username': user.get('username'),
+                'full_name': user.get('full_name'),
+                'is_active': user.get('is_active'),
+                'email': user.get('email'),
+                'role': user.get('role'),
+                'score': user.get('score'),
+                'created_at': user['created_at'].isoformat() if user.get('created_at') else None
+            }
+            for user in users['items']
+        ],
+        **page_meta(users)
     }), 200
 
 @jwt_required()
@@ -63,6 +89,7 @@ def update_user(user_id):
     user = User.objects(id=user_id).first()
     if not user:
         return jsonify({'error': 'Không tìm thấy người dùng'}), 404
+    before = StatsService.user_state(user)
     
     # Cho phép admin cập nhật vai trò
     if 'role' in data:
@@ -74,6 +101,8 @@ def update_user(user_id):
             setattr(user, key, value)
     
     user.save()
+    IdentityService.invalidate(user.id)
+    StatsService.record_user(before, StatsService.user_state(user))
     return jsonify({'message': 'Cập nhật người dùng thành công'}), 200
 
 @jwt_required()
@@ -143,24 +172,14 @@ def change_user_role(user_id):
 @jwt_required()
 @admin_required
 def get_all_images():
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
-    
-    images = ImageService.get_all_images(page, per_page)
+    try:
+        images = ImageService.get_all_images(**page_args(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'images': [
-            {
-                'id': str(img.id),
-                'description': img.description,
-                'url': f"/api/images/file/{str(img.id)}",  # Sửa để sử dụng ID thay vì file_path
-                'created_at': img.created_at.isoformat() if hasattr(img, 'created_at') and img.created_at else None,
-                'uploaded_by': str(img.uploaded_by.id) if img.uploaded_by else None
-            } for img in images.items
-        ],
-        'total': images.total,
-        'pages': images.pages,
-        'page': images.page
+        'images': images['items'],
+        **page_meta(images)
     }), 200
 
 @jwt_required()
@@ -175,29 +194,16 @@ def admin_delete_image(image_id):
 @jwt_required()
 @admin_required
 def get_reports():
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
     status = request.args.get('status', None)
     
-    reports = ImageService.get_reports(page, per_page, status)
+    try:
+        reports = ImageService.get_reports(status=status, **page_args(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'reports': [
-            {
-                'id': str(report.id),
-                'image_id': str(report.image.id),
-                'image_url': f"/api/images/file/{str(report.image.id)}",  # Sửa để sử dụng ID thay vì file_path
-                'image_description': report.image.description,
-                'reported_by': str(report.reported_by.id),
-                'reporter_username': report.reported_by.username if hasattr(report.reported_by, 'username') else "Unknown",
-                'reason': report.reason,
-                'status': report.status,
-                'created_at': report.created_at.isoformat() if hasattr(report, 'created_at') and report.created_at else None
-            } for report in reports.items
-        ],
-        'total': reports.total,
-        'pages': reports.pages,
-        'page': reports.page
+        'reports': reports['items'],
+        **page_meta(reports)
     }), 200
 
 @jwt_required()
@@ -221,13 +227,17 @@ def update_report(report_id):
 @jwt_required()
 @admin_required
 def get_stats():
-    """Lấy thống kê hệ thống cho admin"""
-    user_count = User.objects.count()
-    image_count = Image.objects.count()
-    pending_reports_count = Report.objects(status='pending').count()
-    
-    return jsonify({
-        'users': user_count,
-        'images': image_count,
-        'pending_reports': pending_reports_count
-    }), 200
\ No newline at end of file
+    """
+    Lấy thống kê hệ thống cho admin
+    Các số đếm lấy từ một aggregation $facet, hoặc từ bộ đếm lưu sẵn khi bật STATS_MATERIALIZED
+    """
+    stats = StatsService.get_stats()
+    stats['pending_reports'] = stats['reports_by_status']['pending']
+    
+    return jsonify(stats), 200
+
+@jwt_required()
+@admin_required
+def get_caption_metrics():
+    """Lấy thống kê của bộ gom batch khi tạo caption"""
+    return jsonify(ImageCaptionService.get_metrics()), 200
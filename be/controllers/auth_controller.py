@@ -1,6 +1,7 @@
 # controllers/auth_controller.py
 from flask import request, jsonify
 from services.auth_service import AuthService
+from services.identity_service import IdentityService
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from models.user import User
 
@@ -51,7 +52,8 @@ def login():
             return jsonify({'error': 'Tài khoản đã bị vô hiệu hóa'}), 403
         
         # Tạo token truy cập
-        access_token = create_access_token(identity=str(user.id))
+        # Vai trò và trạng thái được ký kèm trong token để các kiểm tra quyền không phải truy vấn MongoDB
+        access_token = create_access_token(identity=str(user.id), additional_claims=IdentityService.claims_for(user))
         return jsonify({
             'access_token': access_token,
             # 'user': {
@@ -1,8 +1,16 @@
 # controllers/image_caption_controller.py
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from services.image_service import ImageService
 from services.image_caption_service import ImageCaptionService
+from services.caption_job_service import CaptionJobService
+from services.speech_service import SpeechService
+from services.blob_storage import BlobTooLargeError
+from services.bulk_caption_service import BulkCaptionService
+from services.identity_service import IdentityService
+from models.user import User
+from models.image import Image
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import json
 
 @jwt_required()
 def upload_with_caption():
@@ -10,6 +18,9 @@ def upload_with_caption():
     API để tải lên ảnh và tự động tạo caption
     - Lưu ảnh vào MongoDB
     - Tạo caption tự động và lưu vào trường description
+    - Nếu gửi kèm async=true: trả về 202 cùng job id, caption được tạo bởi caption worker
+    - Giọng đọc caption (speak, mặc định bật) được tạo trong nền, tải qua audio_url
+    - profile (fast/balanced/quality/auto) và latency_budget_ms chọn cách giải mã
     """
     try:
         user_id = get_jwt_identity()
@@ -28,6 +39,10 @@ def upload_with_caption():
         if not allowed_file(image_file.filename):
             return jsonify({"error": "Định dạng file không được hỗ trợ"}), 400
         
+        # Kiểm tra tham số giải mã trước khi lưu ảnh
+        decoding = get_decoding_request()
+        profile, params = ImageCaptionService.resolve_decoding(**decoding)
+        
         # 1. Upload ảnh vào MongoDB (không có mô tả ban đầu)
         image = ImageService.upload_image(
             file=image_file,
@@ -35,19 +50,150 @@ def upload_with_caption():
             user_id=user_id
         )
         
-        # 2. Tạo caption từ dữ liệu nhị phân
-        caption = ImageCaptionService.generate_caption_from_binary(image.image_data, speak=True)
+        # Chế độ bất đồng bộ: đưa vào hàng đợi job và trả về ngay
+        if is_async_request():
+            job = CaptionJobService.enqueue(image, user_id, params=decoding, speak=is_speak_request())
+            return jsonify({
+                "success": True,
+                "id": str(image.id),
+                "job_id": str(job.id),
+                "status": job.status,
+                "status_url": f"/api/image-caption/jobs/{str(job.id)}"
+            }), 202
+        
+        # 2. Tạo caption từ dữ liệu nhị phân theo profile giải mã
+        caption = ImageCaptionService.generate_caption_from_binary(
+            ImageService.read_image_data(image), content_hash=image.content_hash, **params
+        )
         
         # 3. Cập nhật mô tả của ảnh với caption vừa tạo
         ImageService.update_image(str(image.id), user_id, caption)
         
-        # 4. Trả về kết quả
+        # 4. Dịch và tạo giọng đọc trong nền, không chặn request
+        if is_speak_request():
+            SpeechService.schedule_for_image(image.id, caption)
+        
+        # 5. Trả về kết quả
         return jsonify({
             "success": True,
             "id": str(image.id),
-            "description": caption
+            "description": caption,
+            "profile": profile,
+            "audio_url": f"/api/image-caption/{str(image.id)}/audio"
         }), 200
         
+    except BlobTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    except Exception as e:
+        print(f"Lỗi không mong đợi: {e}")
+        return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
+
+@jwt_required()
+def upload_with_caption_stream():
+    """
+    API tải lên ảnh và theo dõi quá trình tạo caption qua Server-Sent Events
+    - Các sự kiện: stored, preprocessed, decoding, token (giải mã greedy), caption, audio, done (hoặc error)
+    - Nhận cùng tham số với /upload (profile, latency_budget_ms, speak)
+    """
+    try:
+        user_id = get_jwt_identity()
+        
+        if 'image' not in request.files:
+            return jsonify({"error": "Không tìm thấy file ảnh trong request"}), 400
+            
+        image_file = request.files['image']
+        
+        if image_file.filename == '':
+            return jsonify({"error": "Không có file nào được chọn"}), 400
+        
+        if not allowed_file(image_file.filename):
+            return jsonify({"error": "Định dạng file không được hỗ trợ"}), 400
+        
+        decoding = get_decoding_request()
+        ImageCaptionService.resolve_decoding(**decoding)
+        speak = is_speak_request()
+        
+        image = ImageService.upload_image(file=image_file, description="", user_id=user_id)
+        
+    except BlobTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    except Exception as e:
+        print(f"Lỗi không mong đợi: {e}")
+        return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
+    
+    def generate():
+        image_id = str(image.id)
+        yield format_sse("stored", {"id": image_id, "url": f"/api/images/file/{image_id}"})
+        try:
+            caption = None
+            events = ImageCaptionService.stream_caption(
+                ImageService.read_image_data(image), content_hash=image.content_hash, **decoding
+            )
+            for event, data in events:
+                if event == "caption":
+                    caption = data["description"]
+                    Image.objects(id=image.id).update_one(set__description=caption)
+                yield format_sse(event, data)
+            
+            if speak:
+                audio = SpeechService.schedule_for_image(image.id, caption).result()
+                yield format_sse("audio", {
+                    "status": "ready" if audio else "failed",
+                    "audio_url": f"/api/image-caption/{image_id}/audio"
+                })
+            
+            yield format_sse("done", {"id": image_id, "description": caption})
+            
+        except ValueError as e:
+            yield format_sse("error", {"error": str(e)})
+            
+        except Exception as e:
+            print(f"Lỗi khi stream caption: {e}")
+            yield format_sse("error", {"error": "Lỗi máy chủ nội bộ"})
+    
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@jwt_required()
+def bulk_caption():
+    """
+    API để tải lên nhiều ảnh (trường images, có thể là file zip) và tạo caption hàng loạt
+    - Các ảnh được đưa vào cùng batch suy luận
+    - Kết quả trả về dạng NDJSON, mỗi dòng một ảnh ngay khi ảnh đó xong, dòng cuối là tóm tắt
+    """
+    try:
+        user_id = get_jwt_identity()
+        files = [f for f in request.files.getlist('images') if f.filename]
+        
+        if not files:
+            return jsonify({"error": "Không tìm thấy file ảnh trong request"}), 400
+        
+        _, params = ImageCaptionService.resolve_decoding(**get_decoding_request())
+        speak = is_speak_request()
+        user = User.objects(id=user_id).first()
+        
+        if not user:
+            return jsonify({"error": "Không tìm thấy người dùng"}), 404
+        
+        def generate():
+            for result in BulkCaptionService.run(files, user, params, speak=speak):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        
+        response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+        # Tắt buffer của reverse proxy để client nhận từng dòng ngay
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+        
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
         
@@ -111,12 +257,19 @@ def regenerate_caption(image_id):
         if str(image.uploaded_by.id) != user_id and not hasattr(image.uploaded_by, 'role') or image.uploaded_by.role != 'admin':
             return jsonify({"error": "Không có quyền truy cập ảnh này"}), 403
             
-        # Tạo caption mới từ dữ liệu nhị phân trong MongoDB
-        caption = ImageCaptionService.generate_caption_from_binary(image.image_data)
+        # Tạo caption mới từ dữ liệu nhị phân trong kho blob theo profile giải mã
+        profile, params = ImageCaptionService.resolve_decoding(**get_decoding_request())
+        caption = ImageCaptionService.generate_caption_from_binary(
+            ImageService.read_image_data(image), content_hash=image.content_hash, **params
+        )
         
         # Cập nhật mô tả với caption mới
         ImageService.update_image(image_id, user_id, caption)
         
+        # Tạo lại giọng đọc cho caption mới trong nền
+        if is_speak_request():
+            SpeechService.schedule_for_image(image.id, caption)
+        
         # Trả về kết quả
         return jsonify({
             "success": True,
@@ -125,7 +278,8 @@ def regenerate_caption(image_id):
                 "description": caption,
                 "url": f"/api/images/file/{str(image.id)}",
                 "created_at": image.created_at.isoformat() if hasattr(image, 'created_at') else None
-            }
+            },
+            "profile": profile
         }), 200
         
     except ValueError as e:
@@ -135,6 +289,117 @@ def regenerate_caption(image_id):
         print(f"Lỗi không mong đợi: {e}")
         return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
 
+@jwt_required()
+def get_caption_job(job_id):
+    """
+    API để lấy trạng thái job tạo caption
+    Hỗ trợ long-poll qua tham số wait (giây, tối đa 60)
+    """
+    try:
+        user_id = get_jwt_identity()
+        wait = min(max(float(request.args.get('wait', 0)), 0), 60)
+        
+        if wait > 0:
+            job = CaptionJobService.wait_for_job(job_id, wait)
+        else:
+            job = CaptionJobService.get_job(job_id)
+        
+        if not job:
+            return jsonify({"error": "Không tìm thấy job"}), 404
+        
+        # Chỉ người tạo job hoặc admin mới được xem
+        if not job.requested_by or str(job.requested_by.pk) != user_id:
+            if not IdentityService.is_admin():
+                return jsonify({"error": "Không có quyền truy cập job này"}), 403
+        
+        return jsonify(CaptionJobService.to_dict(job)), 200
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    except Exception as e:
+        print(f"Lỗi không mong đợi: {e}")
+        return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
+
+def get_caption_audio(image_id):
+    """
+    API để tải giọng đọc tiếng Việt của caption
+    - 200: stream audio (hỗ trợ ETag/Range)
+    - 202: audio đang được tạo, client thử lại sau
+    """
+    try:
+        image = ImageService.get_image_by_id(image_id)
+        
+        if not image:
+            return jsonify({"error": "Không tìm thấy ảnh"}), 404
+        
+        if not image.description:
+            return jsonify({"error": "Ảnh chưa có caption"}), 404
+        
+        if SpeechService.is_audio_current(image):
+            # URL cố định nhưng nội dung đổi theo caption: client phải kiểm tra lại bằng ETag mỗi lần
+            return ImageService.send_blob(
+                image.audio['content_hash'], image.audio['content_type'], image.audio['size'],
+                cache_control=ImageService.REVALIDATE_CACHE_CONTROL
+            )
+        
+        # Chưa có audio cho caption hiện tại: tạo trong nền (trừ khi job đang chạy hoặc đang chờ thử lại)
+        if SpeechService.needs_schedule(image):
+            SpeechService.schedule_for_image(image.id, image.description)
+        
+        return jsonify({
+            "status": "pending",
+            "caption_vi": image.caption_vi
+        }), 202
+        
+    except Exception as e:
+        print(f"Lỗi không mong đợi: {e}")
+        return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
+
+def get_readiness():
+    """
+    API kiểm tra sẵn sàng cho load balancer
+    - 200 khi mô hình đã được tải (và warm-up xong), 503 nếu chưa
+    """
+    readiness = ImageCaptionService.get_readiness()
+    return jsonify(readiness), 200 if readiness["ready"] else 503
+
+def get_decoding_profiles():
+    """API liệt kê các profile giải mã cùng độ trễ ước lượng hiện tại"""
+    return jsonify(ImageCaptionService.get_decoding_profiles()), 200
+
+def get_decoding_request():
+    """
+    Đọc profile và latency_budget_ms từ query string, form hoặc JSON.
+    Chỉ trả về các giá trị được gửi lên để job bất đồng bộ tự chọn profile khi xử lý.
+    """
+    data = request.get_json(silent=True) or {}
+    profile = request.args.get('profile', request.form.get('profile', data.get('profile')))
+    budget = request.args.get('latency_budget_ms', request.form.get('latency_budget_ms', data.get('latency_budget_ms')))
+    
+    decoding = {}
+    if profile:
+        decoding['profile'] = str(profile).lower()
+    if budget not in (None, ''):
+        try:
+            decoding['latency_budget_ms'] = float(budget)
+        except (TypeError, ValueError):
+            raise ValueError("latency_budget_ms phải là số")
+        if decoding['latency_budget_ms'] <= 0:
+            raise ValueError("latency_budget_ms phải lớn hơn 0")
+    return decoding
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def is_async_request():
+    value = request.args.get('async', request.form.get('async', 'false'))
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def is_speak_request():
+    value = request.args.get('speak', request.form.get('speak', 'true'))
+    return str(value).lower() in ('1', 'true', 'yes')
+
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     return '.' in filename and \
@@ -1,7 +1,9 @@
 # controllers/image_controller.py
 from flask import request, jsonify, Response
 from services.image_service import ImageService
-from models.user import User
+from services.blob_storage import BlobTooLargeError
+from services.identity_service import IdentityService
+from services.pagination import page_args, page_meta
 from models.report import Report
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import io
@@ -29,55 +31,96 @@ def upload_image():
                 'description': image.description,
                 'url': f"/api/images/file/{str(image.id)}"
             }), 201
+        except BlobTooLargeError as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
     return jsonify({'error': 'Loại tệp không được phép'}), 400
 
 def get_image(image_id):
-    """Trả về dữ liệu nhị phân của ảnh từ MongoDB"""
-    return ImageService.get_image_data(image_id)
+    """Trả về dữ liệu nhị phân của ảnh, hoặc thumbnail nếu có tham số w (độ rộng)"""
+    try:
+        width = int(request.args['w']) if 'w' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Tham số w không hợp lệ'}), 400
+    
+    if width is not None and width <= 0:
+        return jsonify({'error': 'Tham số w không hợp lệ'}), 400
+    
+    return ImageService.get_image_data(
+        image_id,
+        width=width,
+        fmt=request.args.get('format'),
+        accept=request.headers.get('Accept')
+    )
 
 def get_all_images():
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
+    """Danh sách ảnh: page/per_page hoặc cursor (keyset, dùng next_cursor cho trang sau)"""
+    try:
+        args = page_args(request.args)
+        images = ImageService.get_all_images(**args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'images': [
+            {
+                'id': img['id'],
+                'description': img['description'],
+                'url': img['url'],
+                'created_at': img['created_at']
+            } for img in images['items']
+        ],
+        **page_meta(images)
+    }), 200
+
+def search_images():
+    """Tìm ảnh theo nội dung caption (q), xếp theo mức độ liên quan; user_id để chỉ tìm trong ảnh của một người dùng"""
+    query = request.args.get('q', '')
     
-    images = ImageService.get_all_images(page, per_page)
+    try:
+        args = page_args(request.args)
+        images = ImageService.search_images(
+            query, page=args['page'], per_page=args['per_page'], user_id=request.args.get('user_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
         'images': [
             {
-                'id': str(img.id),
-                'description': img.description,
-                'url': f"/api/images/file/{str(img.id)}",
-                'created_at': img.created_at.isoformat() if hasattr(img, 'created_at') else None
-            } for img in images.items
+                'id': img['id'],
+                'description': img['description'],
+                'url': img['url'],
+                'created_at': img['created_at'],
+                'score': img['score']
+            } for img in images['items']
         ],
-        'total': images.total,
-        'pages': images.pages,
-        'page': images.page
+        **page_meta(images)
     }), 200
 
 @jwt_required()
 def get_user_images():
     user_id = get_jwt_identity()
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
-    
-    images = ImageService.get_user_images(user_id, page, per_page)
+    try:
+        args = page_args(request.args)
+        images = ImageService.get_user_images(user_id, **args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
         'images': [
             {
-                'id': str(img.id),
-                'description': img.description,
-                'url': f"/api/images/file/{str(img.id)}",
-                'created_at': img.created_at.isoformat() if hasattr(img, 'created_at') else None
-            } for img in images.items
+                'id': img['id'],
+                'description': img['description'],
+                'url': img['url'],
+                'created_at': img['created_at']
+            } for img in images['items']
         ],
-        'total': images.total,
-        'pages': images.pages,
-        'page': images.page
+        **page_meta(images)
     }), 200
 
 @jwt_required()
@@ -138,37 +181,21 @@ def get_reports():
     Lấy danh sách báo cáo (chỉ admin)
     """
     try:
-        user_id = get_jwt_identity()
-        user = User.objects(id=user_id).first()
-        
         # Kiểm tra quyền admin
-        if not user or user.role != 'admin':
+        if not IdentityService.is_admin():
             return jsonify({"error": "Không có quyền truy cập"}), 403
             
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
         status = request.args.get('status')
-        
-        reports = ImageService.get_reports(page, per_page, status)
+        reports = ImageService.get_reports(status=status, **page_args(request.args))
         
         return jsonify({
-            'reports': [
-                {
-                    'id': str(report.id),
-                    'image_id': str(report.image.id),
-                    'image_url': f"/api/images/file/{str(report.image.id)}",
-                    'reported_by': str(report.reported_by.id),
-                    'reporter_name': f"{report.reported_by.first_name} {report.reported_by.last_name}" if hasattr(report.reported_by, 'first_name') else report.reported_by.username,
-                    'reason': report.reason,
-                    'status': report.status,
-                    'created_at': report.created_at.isoformat()
-                } for report in reports.items
-            ],
-            'total': reports.total,
-            'pages': reports.pages,
-            'page': reports.page
+            'reports': reports['items'],
+            **page_meta(reports)
         }), 200
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
     except Exception as e:
         print(f"Lỗi không mong đợi: {e}")
         return jsonify({"error": "Lỗi máy chủ nội bộ"}), 500
@@ -179,11 +206,8 @@ def update_report_status(report_id):
     Cập nhật trạng thái báo cáo (chỉ admin)
     """
     try:
-        user_id = get_jwt_identity()
-        user = User.objects(id=user_id).first()
-        
         # Kiểm tra quyền admin
-        if not user or user.role != 'admin':
+        if not IdentityService.is_admin():
             return jsonify({"error": "Không có quyền truy cập"}), 403
             
         data = request.get_json()
@@ -17,6 +17,30 @@ def initialize_db(app):
     # Seed dữ liệu nếu cần
     # seed_data(app)
 
+def get_database_name(mongo_uri):
+    """Xác định tên cơ sở dữ liệu từ URI"""
+    db_name = 'airc'  # Tên mặc định nếu không được chỉ định trong URI
+    if '/' in mongo_uri.split('@')[-1]:
+        parts = mongo_uri.split('/')
+        if len(parts) > 3 and parts[3]:
+            db_name = parts[3].split('?')[0] or db_name
+    return db_name
+
+def connect_standalone(mongo_uri=None):
+    """
+    Kết nối MongoDB ngoài Flask app (script chạy từ dòng lệnh, worker nền).
+    Các model MongoEngine dùng được ngay sau khi gọi; trả về database pymongo cho các thao tác thô.
+    """
+    import os
+    import mongoengine
+    from dotenv import load_dotenv
+    
+    load_dotenv()
+    mongo_uri = mongo_uri or os.getenv("MONGODB_URI")
+    db_name = get_database_name(mongo_uri)
+    mongoengine.connect(db=db_name, host=mongo_uri)
+    return mongoengine.connection.get_db()
+
 def setup_migrations(app):
     """
     Thiết lập tự động migration cho MongoDB.
@@ -25,15 +49,7 @@ def setup_migrations(app):
     """
     mongo_uri = app.config['MONGODB_SETTINGS']['host']
     client = MongoClient(mongo_uri)
-    
-    # Xác định tên cơ sở dữ liệu từ URI
-    db_name = 'airc'  # Tên mặc định nếu không được chỉ định trong URI
-    if '/' in mongo_uri.split('@')[-1]:
-        parts = mongo_uri.split('/')
-        if len(parts) > 3 and parts[3]:
-            db_name = parts[3]
-    
-    database = client[db_name]
+    database = client[get_database_name(mongo_uri)]
     
     # Kiểm tra xem collection migrations có tồn tại không
     if 'migrations' not in database.list_collection_names():
@@ -46,8 +62,89 @@ def setup_migrations(app):
 def apply_migrations(database):
     """Áp dụng bất kỳ migrations nào đang chờ xử lý"""
     current_version = database.migrations.find_one({}, sort=[('version', -1)])['version']
-    # Logic migration sẽ được đặt ở đây
-    # Ví dụ: Nếu current_version < 1, áp dụng migration 1, v.v.
+    
+    for version, migration in MIGRATIONS:
+        if current_version < version:
+            logging.info(f"Applying migration {version}: {migration.__name__}")
+            migration(database)
+            database.migrations.insert_one({'version': version, 'applied_at': datetime.now()})
+
+def migrate_image_data_to_blob_storage(database):
+    """
+    Migration 1: chuyển dữ liệu nhị phân image_data ra khỏi document Image sang kho blob.
+    Duyệt bằng cursor theo từng lô nhỏ để không nạp toàn bộ ảnh vào bộ nhớ,
+    mỗi document được cập nhật content_hash/size và xóa trường image_data.
+    """
+    from services.blob_storage import get_blob_storage
+    
+    storage = get_blob_storage()
+    cursor = database.images.find(
+        {'image_data': {'$exists': True}},
+        {'image_data': 1},
+        no_cursor_timeout=True,
+        batch_size=16
+    )
+    migrated = 0
+    try:
+        for doc in cursor:
+            content_hash, size = storage.put(bytes(doc['image_data']))
+            database.images.update_one(
+                {'_id': doc['_id']},
+                {'$set': {'content_hash': content_hash, 'size': size}, '$unset': {'image_data': ''}}
+            )
+            migrated += 1
+    finally:
+        cursor.close()
+    logging.info(f"Moved {migrated} images to blob storage.")
+
+def _build_user_search_keys(database, query):
+    """Tính lại search_keys cho các người dùng khớp query, ghi bằng bulk_write theo lô"""
+    from pymongo import UpdateOne
+    from services.text_search import build_user_search_keys
+    
+    cursor = database.users.find(
+        query,
+        {'username': 1, 'email': 1, 'full_name': 1},
+        no_cursor_timeout=True,
+        batch_size=1000
+    )
+    updates = []
+    migrated = 0
+    try:
+        for doc in cursor:
+            keys = build_user_search_keys(doc.get('username'), doc.get('email'), doc.get('full_name'))
+            updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {'search_keys': keys}}))
+            if len(updates) == 1000:
+                database.users.bulk_write(updates, ordered=False)
+                migrated += len(updates)
+                updates = []
+        if updates:
+            database.users.bulk_write(updates, ordered=False)
+            migrated += len(updates)
+    finally:
+        cursor.close()
+    return migrated
+
+def migrate_user_search_keys(database):
+    """
+    Migration 2: tạo trường search_keys (khóa tìm kiếm đã chuẩn hóa) cho người dùng hiện có.
+    Ghi bằng bulk_write theo lô để chạy được trên collection lớn.
+    """
+    migrated = _build_user_search_keys(database, {'search_keys': {'$exists': False}})
+    database.users.create_index('search_keys')
+    logging.info(f"Built search keys for {migrated} users.")
+
+def migrate_user_search_keys_username_tokens(database):
+    """Migration 3: tính lại search_keys cho mọi người dùng để thêm các từ trong username (john.doe -> john, doe)"""
+    migrated = _build_user_search_keys(database, {})
+    logging.info(f"Rebuilt search keys for {migrated} users.")
+
+# Danh sách migration theo thứ tự phiên bản
+MIGRATIONS = [
+    (1, migrate_image_data_to_blob_storage),
+    (2, migrate_user_search_keys),
+    (3, migrate_user_search_keys_username_tokens),
+]
 
 def seed_data(app):
     """
@@ -0,0 +1,18 @@
+# models/caption_cache.py
+from database.set_up import db
+import datetime
+import os
+
+class CaptionCacheEntry(db.Document):
+    # Khóa: hash ảnh + phiên bản mô hình + tham số sinh caption
+    key = db.StringField(required=True, unique=True)
+    caption = db.StringField(required=True)
+    created_at = db.DateTimeField(default=datetime.datetime.utcnow)  # TTL index của MongoDB so sánh theo UTC
+    
+    meta = {
+        'collection': 'caption_cache',
+        'indexes': [
+            # MongoDB tự xóa các bản ghi quá hạn (TTL index)
+            {'fields': ['created_at'], 'expireAfterSeconds': int(os.getenv("CAPTION_CACHE_TTL_SECONDS", 7 * 24 * 3600))}
+        ]
+    }
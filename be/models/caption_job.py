@@ -0,0 +1,24 @@
+# models/caption_job.py
+from database.set_up import db
+import datetime
+
+class CaptionJob(db.Document):
+    image = db.LazyReferenceField('Image', required=True)
+    requested_by = db.LazyReferenceField('User')
+    status = db.StringField(default="queued", choices=["queued", "running", "done", "failed"])
+    params = db.DictField()  # Tham số sinh caption (max_length, num_beams, ...)
+    speak = db.BooleanField(default=True)  # Tạo giọng đọc sau khi có caption
+    attempts = db.IntField(default=0)
+    description = db.StringField()  # Caption đã sinh khi job hoàn thành
+    error = db.StringField()
+    created_at = db.DateTimeField(default=datetime.datetime.now)
+    started_at = db.DateTimeField()
+    finished_at = db.DateTimeField()
+    
+    meta = {
+        'collection': 'caption_jobs',
+        'indexes': [
+            {'fields': ['status', 'created_at']},
+            {'fields': ['image']}
+        ]
+    }
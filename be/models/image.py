@@ -6,14 +6,29 @@ class Image(db.Document):
     description = db.StringField()
     file_name = db.StringField(required=True)  # Giữ tên file gốc
     content_type = db.StringField(required=True)  # Loại MIME của file
-    image_data = db.BinaryField(required=True)  # Dữ liệu nhị phân của ảnh
+    content_hash = db.StringField(required=True)  # SHA-256 của ảnh, dùng làm khóa trong kho blob
+    size = db.IntField()  # Kích thước ảnh (byte)
+    variants = db.DictField()  # Thumbnail: "w<width>_<format>" -> {content_hash, size, content_type}
+    caption_vi = db.StringField()  # Caption đã dịch sang tiếng Việt
+    audio = db.DictField()  # Giọng đọc caption: {status, content_hash, size, content_type, source_caption}
     uploaded_by = db.ReferenceField('User')
     created_at = db.DateTimeField(default=datetime.datetime.now)
     
     meta = {
         'collection': 'images',
         'indexes': [
-            {'fields': ['uploaded_by']},
-            {'fields': ['created_at']}
+            {'fields': ['content_hash']},
+            # Phân trang keyset theo (created_at, _id), toàn bộ và theo người tải lên
+            {'fields': ['-created_at', '-id']},
+            {'fields': ['uploaded_by', '-created_at', '-id']},
+            # Tìm kiếm caption: caption gốc tiếng Anh và bản tiếng Việt trong cùng một chỉ mục text.
+            # default_language 'none': tách từ đơn giản, không stemming/stop word tiếng Anh (làm mất các từ
+            # tiếng Việt như "to", "do"); chỉ mục text đã không phân biệt hoa thường và dấu.
+            {
+                'fields': ['$description', '$caption_vi'],
+                'default_language': 'none',
+                'weights': {'description': 2, 'caption_vi': 1},
+                'name': 'caption_text'
+            }
         ]
     }
\ No newline at end of file
@@ -13,7 +13,8 @@ class Report(db.Document):
         'collection': 'reports',
         'indexes': [
             {'fields': ['image']},
-            {'fields': ['status']},
-            {'fields': ['created_at']}
+            # Phân trang keyset theo (created_at, _id), toàn bộ và theo trạng thái
+            {'fields': ['-created_at', '-id']},
+            {'fields': ['status', '-created_at', '-id']}
         ]
     }
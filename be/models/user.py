@@ -1,5 +1,6 @@
 # models/user.py
 from database.set_up import db
+from services.text_search import build_user_search_keys
 import datetime
 
 class User(db.Document):
@@ -11,11 +12,21 @@ class User(db.Document):
     role = db.StringField(default="user", choices=["user", "admin"])
     created_at = db.DateTimeField(default=datetime.datetime.now)
     last_login = db.DateTimeField()
+    search_keys = db.ListField(db.StringField())  # Khóa tìm kiếm đã chuẩn hóa (xem services/text_search.py)
     
     meta = {
         'collection': 'users',
         'indexes': [
             {'fields': ['username'], 'unique': True},
-            {'fields': ['email'], 'unique': True}
+            {'fields': ['email'], 'unique': True},
+            {'fields': ['search_keys']},
+            # Phân trang keyset theo (created_at, _id)
+            {'fields': ['-created_at', '-id']},
+            {'fields': ['role', '-created_at', '-id']},
+            {'fields': ['is_active', '-created_at', '-id']}
         ]
     }
+    
+    def clean(self):
+        # Cập nhật khóa tìm kiếm mỗi lần lưu (save() gọi validate() -> clean())
+        self.search_keys = build_user_search_keys(self.username, self.email, self.full_name)
@@ -1,9 +1,20 @@
 # routes/image_caption_routes.py
 from flask import Blueprint
-from controllers.image_caption_controller import upload_with_caption, update_caption, regenerate_caption
+from controllers.image_caption_controller import (
+    upload_with_caption, update_caption, regenerate_caption, get_caption_job,
+    get_caption_audio, get_readiness, get_decoding_profiles, bulk_caption,
+    upload_with_caption_stream
+)
 
 image_caption_routes = Blueprint('image_caption_routes', __name__)
 
+image_caption_routes.route('/ready', methods=['GET'])(get_readiness)
+image_caption_routes.route('/profiles', methods=['GET'])(get_decoding_profiles)
 image_caption_routes.route('/upload', methods=['POST'])(upload_with_caption)
+image_caption_routes.route('/upload/stream', methods=['POST'])(upload_with_caption_stream)
+image_caption_routes.route('/bulk', methods=['POST'])(bulk_caption)
 image_caption_routes.route('/caption/<image_id>', methods=['PUT'])(update_caption)
 image_caption_routes.route('/<image_id>/regenerate', methods=['POST'])(regenerate_caption)
+image_caption_routes.route('/<image_id>/audio', methods=['GET'])(get_caption_audio)
+
+image_caption_routes.route('/jobs/<job_id>', methods=['GET'])(get_caption_job)
\ No newline at end of file
@@ -0,0 +1,149 @@
+# scripts/backfill_captions.py
+"""
+Tạo caption cho các ảnh đã có nhưng chưa có mô tả (ví dụ ảnh tải lên qua POST /api/images/).
+
+- Duyệt collection images theo _id tăng dần bằng cursor, chỉ lấy _id và content_hash.
+- Đọc blob theo từng lô, tạo caption bằng một lần suy luận BLIP cho cả lô.
+- Ghi kết quả bằng bulk_write, chỉ ghi vào ảnh vẫn còn trống mô tả (không đè caption người dùng vừa sửa).
+- Lưu checkpoint (_id cuối cùng đã xử lý) vào collection backfill_checkpoints sau mỗi lô,
+  chạy lại cùng --name sẽ tiếp tục từ chỗ dừng.
+
+Chạy từ thư mục be:
+    python scripts/backfill_captions.py --batch-size 8 --rate 5 --profile balanced
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv  # noqa: E402
+
+# Cấu hình của các service được đọc khi import nên phải nạp .env trước
+load_dotenv()
+
+from pymongo import UpdateOne  # noqa: E402
+from database.set_up import connect_standalone  # noqa: E402
+from services.blob_storage import get_blob_storage  # noqa: E402
+from services.image_caption_service import ImageCaptionService  # noqa: E402
+from services.stats_service import StatsService  # noqa: E402
+
+MISSING_DESCRIPTION = {'description': {'$in': ['', None]}}
+
+
+def load_checkpoint(database, name, restart):
+    if restart:
+        database.backfill_checkpoints.delete_one({'_id': name})
+    return database.backfill_checkpoints.find_one({'_id': name}) or {
+        '_id': name, 'last_id': None, 'processed': 0, 'failed': 0
+    }
+
+
+def save_checkpoint(database, checkpoint):
+    checkpoint['updated_at'] = datetime.datetime.now()
+    database.backfill_checkpoints.replace_one({'_id': checkpoint['_id']}, checkpoint, upsert=True)
+
+
+def iter_batches(database, last_id, batch_size, limit):
+    query = dict(MISSING_DESCRIPTION)
+    if last_id is not None:
+        query['_id'] = {'$gt': last_id}
+    cursor = database.images.find(query, {'content_hash': 1}, no_cursor_timeout=True, batch_size=batch_size * 4) \
+        .sort('_id', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    batch = []
+    try:
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        cursor.close()
+
+
+def caption_batch(storage, docs, params):
+    """Trả về danh sách (doc, caption hoặc Exception) theo thứ tự"""
+    payloads, results = [], []
+    for doc in docs:
+        try:
+            payloads.append((doc['content_hash'], storage.read(doc['content_hash'])))
+            results.append(None)
+        except (KeyError, TypeError) as e:
+            results.append(ValueError(f"Không đọc được blob: {e}"))
+
+    captions = iter(ImageCaptionService._caption_payloads(payloads, **params)) if payloads else iter(())
+    return [(doc, result if result is not None else next(captions)) for doc, result in zip(docs, results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default="captions", help="Tên checkpoint")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("CAPTION_MAX_BATCH_SIZE", 8)))
+    parser.add_argument("--rate", type=float, default=0, help="Số ảnh tối đa mỗi giây (0: không giới hạn)")
+    parser.add_argument("--profile", default="quality", help="Profile giải mã: fast, balanced, quality")
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ xử lý tối đa số ảnh này trong lần chạy")
+    parser.add_argument("--restart", action="store_true", help="Bỏ checkpoint cũ và chạy lại từ đầu")
+    parser.add_argument("--dry-run", action="store_true", help="Tạo caption nhưng không ghi vào database")
+    args = parser.parse_args()
+
+    database = connect_standalone()
+    storage = get_blob_storage()
+    _, params = ImageCaptionService.resolve_decoding(args.profile)
+    checkpoint = load_checkpoint(database, args.name, args.restart)
+
+    remaining = database.images.count_documents(
+        dict(MISSING_DESCRIPTION, **({'_id': {'$gt': checkpoint['last_id']}} if checkpoint['last_id'] else {}))
+    )
+    print(f"Còn {remaining} ảnh chưa có caption, tiếp tục từ {checkpoint['last_id'] or 'đầu'} "
+          f"(đã xử lý {checkpoint['processed']}, lỗi {checkpoint['failed']})")
+
+    ImageCaptionService._load_model_if_needed()
+    started = time.perf_counter()
+    done = 0
+    for docs in iter_batches(database, checkpoint['last_id'], args.batch_size, args.limit):
+        batch_started = time.perf_counter()
+        results = caption_batch(storage, docs, params)
+
+        updates = [
+            UpdateOne(dict(MISSING_DESCRIPTION, _id=doc['_id']), {'$set': {'description': caption}})
+            for doc, caption in results if not isinstance(caption, Exception)
+        ]
+        failed = [(doc, error) for doc, error in results if isinstance(error, Exception)]
+        for doc, error in failed:
+            print(f"⚠️ Bỏ qua ảnh {doc['_id']}: {error}")
+        if updates and not args.dry_run:
+            database.images.bulk_write(updates, ordered=False)
+            StatsService.record_captions(len(updates))
+
+        checkpoint['last_id'] = docs[-1]['_id']
+        checkpoint['processed'] += len(updates)
+        checkpoint['failed'] += len(failed)
+        if not args.dry_run:
+            save_checkpoint(database, checkpoint)
+
+        done += len(docs)
+        elapsed = time.perf_counter() - started
+        throughput = done / elapsed if elapsed else 0
+        eta = (remaining - done) / throughput if throughput else 0
+        print(f"{done}/{remaining} ảnh | {throughput:.2f} ảnh/s | "
+              f"lô {len(docs)} ảnh trong {time.perf_counter() - batch_started:.2f}s | còn khoảng {eta / 60:.1f} phút")
+
+        # Giới hạn tốc độ: chờ cho đủ thời gian tương ứng với số ảnh của lô
+        if args.rate > 0:
+            delay = len(docs) / args.rate - (time.perf_counter() - batch_started)
+            if delay > 0:
+                time.sleep(delay)
+
+    elapsed = time.perf_counter() - started
+    print(f"Hoàn tất {done} ảnh trong {elapsed:.1f}s ({done / elapsed if elapsed else 0:.2f} ảnh/s), "
+          f"tổng đã xử lý {checkpoint['processed']}, lỗi {checkpoint['failed']}")
+
+
+if __name__ == "__main__":
+    main()
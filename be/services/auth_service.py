@@ -1,6 +1,7 @@
 # services/auth_service.py
 from werkzeug.security import generate_password_hash, check_password_hash
 from models.user import User
+from services.stats_service import StatsService
 import datetime
 import re
 
@@ -62,6 +63,7 @@ class AuthService:
             is_active=is_active   # Thêm is_active
         )
         user.save()
+        StatsService.record_user(None, StatsService.user_state(user))
         return user
     
     @staticmethod
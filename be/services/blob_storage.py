@@ -0,0 +1,207 @@
+# services/blob_storage.py
+import hashlib
+import os
+import tempfile
+import threading
+
+class BlobTooLargeError(ValueError):
+    """Dữ liệu vượt quá kích thước tối đa cho phép"""
+
+    def __init__(self, max_size):
+        super().__init__(f"Dữ liệu vượt quá kích thước tối đa {max_size} byte")
+        self.max_size = max_size
+
+
+class BlobStorage:
+    """
+    Lớp cơ sở cho kho lưu trữ dữ liệu nhị phân, định danh theo SHA-256 của nội dung.
+    Cùng một nội dung chỉ được lưu một lần (content-addressed).
+    """
+
+    @staticmethod
+    def compute_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data):
+        """Lưu dữ liệu, trả về (content_hash, size)"""
+        content_hash = self.compute_hash(data)
+        if not self.exists(content_hash):
+            self._write(content_hash, data)
+        return content_hash, len(data)
+
+    def put_stream(self, stream, max_size=None, validate=None, chunk_size=64 * 1024, head_size=32):
+        """
+        Lưu dữ liệu từ stream theo từng chunk: băm, đếm kích thước và ghi ra file tạm cùng lúc,
+        nên bộ nhớ cho mỗi lần lưu chỉ bằng một chunk dù dữ liệu lớn đến đâu.
+        - max_size: vượt quá thì dừng ngay và ném BlobTooLargeError
+        - validate(head): kiểm tra các byte đầu (ví dụ nhận dạng định dạng) trước khi blob được ghi vào kho
+        Trả về (content_hash, size, validate(head) hoặc None).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, temp_path = tempfile.mkstemp(dir=self._staging_dir(), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise BlobTooLargeError(max_size)
+                    if len(head) < head_size:
+                        head += chunk[:head_size - len(head)]
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            result = validate(head) if validate else None
+            content_hash = digest.hexdigest()
+            if not self.exists(content_hash):
+                self._write_file(content_hash, temp_path)
+            return content_hash, size, result
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def read(self, content_hash):
+        """Đọc toàn bộ dữ liệu của blob"""
+        f = self.open(content_hash)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def open(self, content_hash):
+        """Mở blob dưới dạng file-like object có thể seek"""
+        raise NotImplementedError
+
+    def exists(self, content_hash):
+        raise NotImplementedError
+
+    def delete(self, content_hash):
+        raise NotImplementedError
+
+    def _write(self, content_hash, data):
+        raise NotImplementedError
+
+    def _write_file(self, content_hash, path):
+        """Ghi blob từ file tạm đã đầy đủ nội dung"""
+        raise NotImplementedError
+
+    def _staging_dir(self):
+        """Thư mục chứa file tạm khi lưu từ stream (None: thư mục tạm của hệ thống)"""
+        return None
+
+
+class FileSystemBlobStorage(BlobStorage):
+    """Lưu blob trên ổ đĩa: <root>/<2 ký tự đầu của hash>/<hash>"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def open(self, content_hash):
+        try:
+            return open(self._path(content_hash), "rb")
+        except FileNotFoundError:
+            raise KeyError(content_hash)
+
+    def exists(self, content_hash):
+        return os.path.exists(self._path(content_hash))
+
+    def delete(self, content_hash):
+        try:
+            os.remove(self._path(content_hash))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, content_hash, data):
+        path = self._path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên để không bao giờ để lại blob ghi dở
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _write_file(self, content_hash, path):
+        target = self._path(content_hash)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # File tạm nằm cùng ổ đĩa với kho nên chỉ cần đổi tên, không phải sao chép
+        os.replace(path, target)
+
+    def _staging_dir(self):
+        return self.root
+
+
+class GridFSBlobStorage(BlobStorage):
+    """Lưu blob trong GridFS của MongoDB, _id của file chính là hash"""
+
+    def __init__(self, collection="blobs"):
+        import gridfs
+        from mongoengine.connection import get_db
+
+        self._fs = gridfs.GridFS(get_db(), collection=collection)
+
+    def open(self, content_hash):
+        import gridfs
+
+        try:
+            return self._fs.get(content_hash)
+        except gridfs.errors.NoFile:
+            raise KeyError(content_hash)
+
+    def exists(self, content_hash):
+        return self._fs.exists(content_hash)
+
+    def delete(self, content_hash):
+        self._fs.delete(content_hash)
+
+    def _write(self, content_hash, data):
+        import gridfs
+
+        try:
+            self._fs.put(data, _id=content_hash, filename=content_hash)
+        except gridfs.errors.FileExists:
+            pass
+
+    def _write_file(self, content_hash, path):
+        # GridFS đọc file theo từng chunk khi ghi
+        with open(path, "rb") as f:
+            self._write(content_hash, f)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+DEFAULT_BLOB_STORAGE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "uploads", "images")
+)
+
+def get_blob_storage():
+    """
+    Trả về kho blob dùng chung theo cấu hình:
+    - BLOB_STORAGE_BACKEND: "filesystem" (mặc định) hoặc "gridfs"
+    - BLOB_STORAGE_PATH: thư mục gốc cho backend filesystem
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = os.getenv("BLOB_STORAGE_BACKEND", "filesystem").lower()
+                if backend == "gridfs":
+                    _storage = GridFSBlobStorage()
+                elif backend == "filesystem":
+                    _storage = FileSystemBlobStorage(os.getenv("BLOB_STORAGE_PATH", DEFAULT_BLOB_STORAGE_PATH))
+                else:
+                    raise ValueError(f"Backend lưu trữ không hợp lệ: {backend}")
+    return _storage
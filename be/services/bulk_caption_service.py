@@ -0,0 +1,183 @@
+# services/bulk_caption_service.py
+from models.image import Image
+from services.image_service import ImageService
+from services.image_caption_service import ImageCaptionService
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import os
+import zipfile
+import zlib
+
+class BulkCaptionService:
+    """
+    Tạo caption cho nhiều ảnh trong một request (nhiều file hoặc file zip).
+    - Các ảnh được lưu lần lượt qua ImageService (đọc theo chunk, không giải nén toàn bộ zip vào bộ nhớ).
+    - Việc tạo caption chạy đồng thời để CaptionBatcher gom chúng vào cùng batch suy luận.
+    - Kết quả của từng ảnh được trả về ngay khi xong (không theo thứ tự gửi lên).
+    """
+
+    _max_files = int(os.getenv("BULK_MAX_FILES", 200))
+    # Lỗi khi mở/đọc một mục trong file zip: zip hỏng, mục bị mã hóa (RuntimeError),
+    # phương thức nén không hỗ trợ (NotImplementedError), dữ liệu nén hỏng (zlib.error, EOFError)
+    ARCHIVE_ERRORS = (zipfile.BadZipFile, zipfile.LargeZipFile, RuntimeError, NotImplementedError, zlib.error, EOFError)
+    # Kích thước tối đa của cả request bulk (BULK_MAX_MB), mỗi ảnh vẫn bị giới hạn bởi MAX_UPLOAD_MB
+    MAX_REQUEST_SIZE = int(float(os.getenv("BULK_MAX_MB", 256)) * 1024 * 1024)
+    # Số caption chạy đồng thời, nên >= CAPTION_MAX_BATCH_SIZE để batch được lấp đầy
+    _executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("BULK_CAPTION_WORKERS", os.getenv("CAPTION_MAX_BATCH_SIZE", 8))),
+        thread_name_prefix="bulk-caption"
+    )
+
+    @staticmethod
+    def _is_zip(file):
+        is_zip = zipfile.is_zipfile(file.stream)
+        file.stream.seek(0)
+        return is_zip
+
+    @classmethod
+    def iter_entries(cls, files):
+        """
+        Duyệt các ảnh gửi lên, trả về lần lượt (tên file, stream), tối đa BULK_MAX_FILES ảnh.
+        File zip được mở từng mục một, bỏ qua thư mục và file ẩn (__MACOSX, .DS_Store...).
+        File zip hoặc mục không mở được trả về (tên, exception) thay cho stream.
+        Giá trị trả về của generator là số ảnh bị bỏ qua do vượt quá giới hạn.
+        """
+        count = 0
+        skipped = 0
+        for file in files:
+            if not cls._is_zip(file):
+                count += 1
+                if count > cls._max_files:
+                    skipped += 1
+                    continue
+                yield file.filename, file.stream
+                continue
+
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except cls.ARCHIVE_ERRORS as e:
+                count += 1
+                yield file.filename, ValueError(f"File zip bị lỗi: {e}")
+                continue
+
+            with archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                        continue
+                    count += 1
+                    if count > cls._max_files:
+                        skipped += 1
+                        continue
+                    try:
+                        stream = archive.open(info)
+                    except cls.ARCHIVE_ERRORS as e:
+                        yield name, ValueError(f"Không đọc được mục trong file zip: {e}")
+                        continue
+                    with stream:
+                        yield name, stream
+        return skipped
+
+    @staticmethod
+    def _caption(image, params, speak):
+        caption = ImageCaptionService.generate_caption_from_binary(
+            ImageService.read_image_data(image), content_hash=image.content_hash, **params
+        )
+        Image.objects(id=image.id).update_one(set__description=caption)
+
+        if speak:
+            from services.speech_service import SpeechService
+            SpeechService.schedule_for_image(image.id, caption)
+        return caption
+
+    @staticmethod
+    def _result(index, file_name, image=None, caption=None, error=None):
+        result = {"index": index, "file_name": file_name}
+        if image is not None:
+            result["id"] = str(image.id)
+            result["url"] = f"/api/images/file/{str(image.id)}"
+        if error is not None:
+            result["status"] = "failed"
+            result["error"] = error
+        else:
+            result["status"] = "done"
+            result["description"] = caption
+            result["audio_url"] = f"/api/image-caption/{str(image.id)}/audio"
+        return result
+
+    @classmethod
+    def _collect(cls, pending, block):
+        """Trả về kết quả của các caption đã xong (chờ ít nhất một nếu block)"""
+        if not pending:
+            return
+        done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, file_name, image = pending.pop(future)
+            try:
+                yield cls._result(index, file_name, image, caption=future.result())
+            except ValueError as e:
+                yield cls._result(index, file_name, image, error=str(e))
+            except Exception as e:
+                print(f"Lỗi khi tạo caption cho {file_name}: {e}")
+                yield cls._result(index, file_name, image, error="Lỗi khi tạo caption")
+
+    @classmethod
+    def run(cls, files, user, params, speak=True):
+        """
+        Lưu và tạo caption cho các ảnh gửi lên, trả về (generator) kết quả của từng ảnh,
+        nếu vượt quá BULK_MAX_FILES thì thêm một dòng {"error", "skipped"},
+        cuối cùng là bản tóm tắt {"done": true, "total", "succeeded", "failed", "skipped"}.
+        """
+        pending = {}
+        counts = {"done": 0, "failed": 0}
+
+        def track(results):
+            for result in results:
+                counts[result["status"]] += 1
+                yield result
+
+        entries = cls.iter_entries(files)
+        total = 0
+        while True:
+            try:
+                file_name, stream = next(entries)
+            except StopIteration as stop:
+                skipped = stop.value or 0
+                break
+            index = total
+            total += 1
+            if isinstance(stream, Exception):
+                yield from track([cls._result(index, file_name, error=str(stream))])
+                continue
+            try:
+                image = ImageService.store_image(stream, file_name, "", user)
+            except ValueError as e:
+                yield from track([cls._result(index, file_name, error=str(e))])
+                continue
+            except cls.ARCHIVE_ERRORS as e:
+                # Dữ liệu nén của mục bị hỏng, chỉ phát hiện được khi đọc
+                yield from track([cls._result(index, file_name, error=f"Không đọc được mục trong file zip: {e}")])
+                continue
+            except Exception as e:
+                print(f"Lỗi khi lưu ảnh {file_name}: {e}")
+                yield from track([cls._result(index, file_name, error="Lỗi khi lưu ảnh")])
+                continue
+            pending[cls._executor.submit(cls._caption, image, params, speak)] = (index, file_name, image)
+            # Trả về các kết quả đã xong trong lúc vẫn đang lưu các ảnh tiếp theo
+            yield from track(cls._collect(pending, block=False))
+
+        while pending:
+            yield from track(cls._collect(pending, block=True))
+
+        if skipped:
+            yield {
+                "error": f"Chỉ xử lý tối đa {cls._max_files} ảnh mỗi request, đã bỏ qua {skipped} ảnh",
+                "skipped": skipped
+            }
+
+        yield {
+            "done": True,
+            "total": total,
+            "succeeded": counts["done"],
+            "failed": counts["failed"],
+            "skipped": skipped
+        }
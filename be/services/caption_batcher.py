@@ -0,0 +1,128 @@
+# services/caption_batcher.py
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+
+class _PendingCaption:
+    """Một yêu cầu tạo caption đang chờ được gom vào batch"""
+    __slots__ = ("payload", "params", "future", "enqueued_at")
+
+    def __init__(self, payload, params):
+        self.payload = payload
+        self.params = params
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchMetrics:
+    """Thống kê kích thước batch và thời gian chờ trong hàng đợi"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.inference_total = 0.0
+
+    def record(self, batch_size, waits, inference_seconds):
+        with self._lock:
+            self.batches += 1
+            self.items += batch_size
+            self.batch_sizes[batch_size] = self.batch_sizes.get(batch_size, 0) + 1
+            self.queue_wait_total += sum(waits)
+            self.queue_wait_max = max([self.queue_wait_max] + list(waits))
+            self.inference_total += inference_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 3) if self.batches else 0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "avg_queue_wait_ms": round(self.queue_wait_total * 1000 / self.items, 3) if self.items else 0,
+                "max_queue_wait_ms": round(self.queue_wait_max * 1000, 3),
+                "avg_batch_inference_ms": round(self.inference_total * 1000 / self.batches, 3) if self.batches else 0
+            }
+
+
+class CaptionBatcher:
+    """
+    Bộ lập lịch gom batch động (micro-batching) đặt trước mô hình.
+    - Gom các yêu cầu đang chờ trong tối đa max_wait_ms hoặc đến khi đủ max_batch_size.
+    - Các yêu cầu có cùng tham số sinh được chạy chung một lần generate.
+    - Kết quả được trả về cho từng người gọi qua Future.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=20, name="caption-batcher"):
+        # run_batch(payloads, **params) -> danh sách caption (hoặc Exception) theo đúng thứ tự payloads
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms) / 1000.0)
+        self.metrics = BatchMetrics()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, payload, **params):
+        """Đưa một yêu cầu vào hàng đợi, trả về Future chứa caption"""
+        pending = _PendingCaption(payload, params)
+        self._queue.put(pending)
+        return pending.future
+
+    def queue_depth(self):
+        """Số yêu cầu đang chờ trong hàng đợi"""
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Đã quá hạn chờ (thường do batch trước chạy lâu): vẫn lấy hết các yêu cầu
+                    # đang có sẵn trong hàng đợi, chỉ không chờ thêm yêu cầu mới
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+
+            # Chia batch theo tham số sinh (max_length, num_beams, ...)
+            groups = {}
+            for item in batch:
+                key = tuple(sorted(item.params.items()))
+                groups.setdefault(key, []).append(item)
+
+            for items in groups.values():
+                self._run_group(items)
+
+    def _run_group(self, items):
+        started = time.perf_counter()
+        waits = [started - item.enqueued_at for item in items]
+        try:
+            results = self._run_batch([item.payload for item in items], **items[0].params)
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+        finally:
+            self.metrics.record(len(items), waits, time.perf_counter() - started)
+
+        # run_batch có thể trả về Exception cho từng phần tử lỗi mà không làm hỏng cả batch
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
@@ -0,0 +1,108 @@
+# services/caption_cache.py
+from collections import OrderedDict
+import threading
+import os
+
+class LRUCache:
+    """Bộ nhớ đệm LRU an toàn luồng với số phần tử tối đa"""
+
+    def __init__(self, max_size):
+        self.max_size = max(0, int(max_size))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CaptionCache:
+    """
+    Cache kết quả caption theo (hash ảnh, phiên bản mô hình, max_length, num_beams, min_length).
+    - Tầng 1: LRU trong process.
+    - Tầng 2: collection caption_cache trong MongoDB dùng chung giữa các process, tự hết hạn qua TTL index.
+    """
+
+    _memory = LRUCache(int(os.getenv("CAPTION_CACHE_SIZE", 1024)))
+    _db_enabled = os.getenv("CAPTION_CACHE_DB", "true").lower() == "true"
+
+    _counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+    _counters_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash, model_revision, max_length, num_beams, min_length):
+        return f"{content_hash}:{model_revision}:{max_length}:{num_beams}:{min_length}"
+
+    @classmethod
+    def _count(cls, name):
+        with cls._counters_lock:
+            cls._counters[name] += 1
+
+    @classmethod
+    def get(cls, key):
+        caption = cls._memory.get(key)
+        if caption is not None:
+            cls._count("memory_hits")
+            return caption
+
+        if cls._db_enabled:
+            from models.caption_cache import CaptionCacheEntry
+            try:
+                entry = CaptionCacheEntry.objects(key=key).only('caption').first()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi đọc caption cache: {e}")
+                entry = None
+            if entry:
+                cls._memory.put(key, entry.caption)
+                cls._count("db_hits")
+                return entry.caption
+
+        cls._count("misses")
+        return None
+
+    @classmethod
+    def put(cls, key, caption):
+        cls._memory.put(key, caption)
+        if cls._db_enabled:
+            from models.caption_cache import CaptionCacheEntry
+            import datetime
+            try:
+                CaptionCacheEntry.objects(key=key).update_one(
+                    set__caption=caption,
+                    set__created_at=datetime.datetime.utcnow(),
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"⚠️ Lỗi khi ghi caption cache: {e}")
+
+    @classmethod
+    def stats(cls):
+        with cls._counters_lock:
+            counters = dict(cls._counters)
+        lookups = sum(counters.values())
+        counters["hit_rate"] = round((counters["memory_hits"] + counters["db_hits"]) / lookups, 4) if lookups else 0
+        counters["memory_entries"] = len(cls._memory)
+        return counters
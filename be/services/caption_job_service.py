@@ -0,0 +1,160 @@
+# services/caption_job_service.py
+from models.caption_job import CaptionJob
+from models.image import Image
+from models.user import User
+from services.image_service import ImageService
+import threading
+import datetime
+import time
+import os
+
+class CaptionJobService:
+    """
+    Hàng đợi job tạo caption bất đồng bộ, lưu bền vững trong MongoDB (collection caption_jobs).
+    - Upload trả về ngay job id, các worker trong pool sẽ lấy job và tạo caption.
+    - Job được nhận (claim) bằng find_one_and_update nên an toàn khi chạy nhiều process.
+    - Job "running" quá lâu (process bị tắt giữa chừng) sẽ được đưa lại vào hàng đợi, tối đa CAPTION_JOB_MAX_ATTEMPTS lần.
+    """
+
+    FINISHED_STATUSES = ("done", "failed")
+
+    _worker_count = int(os.getenv("CAPTION_WORKERS", 2))
+    _poll_interval = float(os.getenv("CAPTION_JOB_POLL_INTERVAL", 1.0))
+    _stale_after = int(os.getenv("CAPTION_JOB_STALE_SECONDS", 600))
+    _max_attempts = int(os.getenv("CAPTION_JOB_MAX_ATTEMPTS", 3))
+
+    _workers = []
+    _workers_lock = threading.Lock()
+    _wakeup = threading.Event()
+
+    @classmethod
+    def enqueue(cls, image, user_id, params=None, speak=True):
+        """Tạo job tạo caption cho ảnh đã lưu"""
+        user = User.objects(id=user_id).first()
+        job = CaptionJob(
+            image=image,
+            requested_by=user,
+            params=params or {},
+            speak=speak
+        )
+        job.save()
+        cls._wakeup.set()
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        """Lấy job theo ID"""
+        return CaptionJob.objects(id=job_id).first()
+
+    @classmethod
+    def wait_for_job(cls, job_id, timeout):
+        """Long-poll: chờ đến khi job hoàn thành hoặc hết thời gian chờ"""
+        deadline = time.monotonic() + timeout
+        job = cls.get_job(job_id)
+        while job and job.status not in cls.FINISHED_STATUSES and time.monotonic() < deadline:
+            time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+            job = cls.get_job(job_id)
+        return job
+
+    @classmethod
+    def start_workers(cls):
+        """Khởi động pool worker (chỉ một lần cho mỗi process)"""
+        with cls._workers_lock:
+            if cls._workers or cls._worker_count <= 0:
+                return
+            cls._requeue_stale_jobs()
+            for i in range(cls._worker_count):
+                worker = threading.Thread(target=cls._worker_loop, name=f"caption-worker-{i}", daemon=True)
+                worker.start()
+                cls._workers.append(worker)
+            print(f"Đã khởi động {cls._worker_count} caption worker")
+
+    @classmethod
+    def _requeue_stale_jobs(cls):
+        """
+        Đưa job "running" quá lâu trở lại hàng đợi nếu còn lượt thử; job đã thử đủ _max_attempts lần
+        (ví dụ luôn làm chết process vì hết bộ nhớ) bị đánh dấu failed thay vì được nhận lại mãi.
+        """
+        now = datetime.datetime.now()
+        stale_before = now - datetime.timedelta(seconds=cls._stale_after)
+        CaptionJob.objects(status="running", started_at__lt=stale_before, attempts__lt=cls._max_attempts).update(
+            set__status="queued"
+        )
+        CaptionJob.objects(status="running", started_at__lt=stale_before, attempts__gte=cls._max_attempts).update(
+            set__status="failed",
+            set__error=f"Job bị dừng giữa chừng {cls._max_attempts} lần (process bị tắt khi đang xử lý)",
+            set__finished_at=now
+        )
+
+    @staticmethod
+    def _claim_next():
+        return CaptionJob.objects(status="queued").order_by('created_at').modify(
+            set__status="running",
+            set__started_at=datetime.datetime.now(),
+            inc__attempts=1,
+            new=True
+        )
+
+    @classmethod
+    def _worker_loop(cls):
+        last_requeue = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() - last_requeue > cls._stale_after:
+                    cls._requeue_stale_jobs()
+                    last_requeue = time.monotonic()
+
+                job = cls._claim_next()
+                if not job:
+                    cls._wakeup.wait(cls._poll_interval)
+                    cls._wakeup.clear()
+                    continue
+                cls._process(job)
+            except Exception as e:
+                print(f"⚠️ Lỗi trong caption worker: {e}")
+                time.sleep(cls._poll_interval)
+
+    @classmethod
+    def _process(cls, job):
+        from services.image_caption_service import ImageCaptionService
+
+        try:
+            image = Image.objects(id=job.image.pk).first()
+            if not image:
+                raise ValueError("Không tìm thấy ảnh của job")
+
+            caption = ImageCaptionService.generate_caption_from_binary(
+                ImageService.read_image_data(image), content_hash=image.content_hash, **job.params
+            )
+            Image.objects(id=image.id).update_one(set__description=caption)
+            
+            if job.speak:
+                from services.speech_service import SpeechService
+                SpeechService.schedule_for_image(image.id, caption)
+
+            job.update(
+                set__status="done",
+                set__description=caption,
+                set__finished_at=datetime.datetime.now(),
+                unset__error=True
+            )
+        except Exception as e:
+            print(f"Lỗi khi xử lý caption job {job.id}: {e}")
+            # Lỗi dữ liệu (ValueError) không thử lại, các lỗi khác thử lại tối đa _max_attempts lần
+            if job.attempts < cls._max_attempts and not isinstance(e, ValueError):
+                job.update(set__status="queued", set__error=str(e))
+            else:
+                job.update(set__status="failed", set__error=str(e), set__finished_at=datetime.datetime.now())
+
+    @staticmethod
+    def to_dict(job):
+        return {
+            "id": str(job.id),
+            "image_id": str(job.image.pk),
+            "status": job.status,
+            "description": job.description,
+            "error": job.error,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
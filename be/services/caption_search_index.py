@@ -0,0 +1,114 @@
+# services/caption_search_index.py
+from services.text_search import tokenize, query_tokens
+from array import array
+import heapq
+import math
+import threading
+import time
+import os
+
+
+class CaptionSearchIndex:
+    """
+    Chỉ mục ngược (token -> danh sách ảnh) cho caption, nằm trong bộ nhớ tiến trình.
+    - Bật bằng CAPTION_SEARCH_INDEX=memory (mặc định dùng chỉ mục text của MongoDB).
+    - Token được chuẩn hóa như tìm kiếm người dùng (bỏ dấu, cả đ -> d) cho description và caption_vi.
+    - Xếp hạng theo tổng IDF của các từ khớp, cùng điểm thì ảnh mới hơn đứng trước.
+    - Được dựng lại toàn bộ mỗi CAPTION_SEARCH_REFRESH_SECONDS giây bởi một luồng nền: caption mới
+      chỉ tìm thấy được sau lần dựng kế tiếp. Kết quả luôn được đọc lại từ MongoDB nên ảnh đã xóa không bị trả về.
+    """
+
+    _enabled = os.getenv("CAPTION_SEARCH_INDEX", "mongo").lower() == "memory"
+    _refresh_interval = float(os.getenv("CAPTION_SEARCH_REFRESH_SECONDS", 300))
+    _shared = None
+    _shared_lock = threading.Lock()
+    _refresher = None
+
+    # Chỉ đọc các trường cần để dựng chỉ mục
+    PROJECTION = {'description': 1, 'caption_vi': 1, 'uploaded_by': 1}
+
+    def __init__(self):
+        self._ids = []
+        self._owners = []
+        self._postings = {}
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, object_id, owner, *texts):
+        """Thêm một ảnh; ảnh phải được thêm theo thứ tự từ cũ đến mới"""
+        position = len(self._ids)
+        self._ids.append(object_id)
+        self._owners.append(owner)
+        for token in set(token for text in texts for token in tokenize(text)):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = array('I')
+            postings.append(position)
+
+    def build(self, docs):
+        """Dựng từ các document thô (có _id, description, caption_vi, uploaded_by), sắp theo thứ tự cũ đến mới"""
+        for doc in docs:
+            self.add(doc['_id'], doc.get('uploaded_by'), doc.get('description'), doc.get('caption_vi'))
+        self.built_at = time.time()
+        return self
+
+    @classmethod
+    def from_collection(cls, collection):
+        cursor = collection.find({}, cls.PROJECTION).sort([('created_at', 1), ('_id', 1)])
+        return cls().build(cursor)
+
+    def search(self, query, offset=0, limit=20, owner=None):
+        """Trả về danh sách (_id, điểm) theo thứ tự liên quan giảm dần"""
+        total = len(self._ids)
+        scores = {}
+        for token in query_tokens(query):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            weight = math.log(1 + total / len(postings))
+            for position in postings:
+                scores[position] = scores.get(position, 0) + weight
+
+        if owner is not None:
+            scores = {position: score for position, score in scores.items() if self._owners[position] == owner}
+
+        # Vị trí lớn hơn là ảnh mới hơn
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(self._ids[position], round(score, 4)) for position, score in top[offset:]]
+
+    # ---- Chỉ mục dùng chung của tiến trình ----
+
+    @classmethod
+    def enabled(cls):
+        return cls._enabled
+
+    @classmethod
+    def _rebuild(cls):
+        from models.image import Image
+        index = cls.from_collection(Image._get_collection())
+        # Thay cả chỉ mục một lần, các truy vấn đang chạy vẫn đọc chỉ mục cũ
+        cls._shared = index
+        return index
+
+    @classmethod
+    def _refresh_loop(cls):
+        while True:
+            time.sleep(cls._refresh_interval)
+            try:
+                cls._rebuild()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi dựng lại chỉ mục caption: {e}")
+
+    @classmethod
+    def shared(cls):
+        """Chỉ mục của tiến trình, dựng ở lần gọi đầu tiên rồi khởi động luồng làm mới"""
+        if cls._shared is not None:
+            return cls._shared
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._rebuild()
+                cls._refresher = threading.Thread(target=cls._refresh_loop, name="caption-search-refresh", daemon=True)
+                cls._refresher.start()
+        return cls._shared
@@ -0,0 +1,171 @@
+# services/embedding_cache.py
+from collections import OrderedDict
+import threading
+import warnings
+import os
+
+class EmbeddingCache:
+    """
+    Cache image_embeds (đầu ra vision encoder) theo hash ảnh và phiên bản mô hình, để khi tạo lại caption
+    với tham số khác chỉ cần chạy text decoder.
+    - Tầng 1: LRU trong bộ nhớ, giới hạn theo tổng số byte (EMBEDDING_CACHE_MAX_MB).
+    - Tầng 2 (tùy chọn): file .npy trên đĩa đọc bằng memory-map (EMBEDDING_CACHE_DIR), giới hạn theo
+      EMBEDDING_CACHE_DISK_MAX_MB; khi vượt quá, xóa các file ít được dùng gần đây nhất (theo mtime,
+      được cập nhật mỗi lần đọc) cho đến khi còn DISK_EVICT_RATIO dung lượng.
+    """
+
+    _max_bytes = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", 256)) * 1024 * 1024)
+    _disk_dir = os.getenv("EMBEDDING_CACHE_DIR")
+    _disk_max_bytes = int(float(os.getenv("EMBEDDING_CACHE_DISK_MAX_MB", 2048)) * 1024 * 1024)
+
+    # Xóa bớt xuống dưới tỉ lệ này của giới hạn để không phải dọn lại sau mỗi lần ghi
+    DISK_EVICT_RATIO = 0.9
+
+    _entries = OrderedDict()
+    _total_bytes = 0
+    _disk_bytes = None  # Ước lượng dung lượng trên đĩa, tính bằng cách quét thư mục ở lần ghi đầu tiên
+    _lock = threading.Lock()
+    _disk_lock = threading.Lock()
+    _counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(content_hash, model_revision):
+        return f"{content_hash}_{model_revision}"
+
+    @classmethod
+    def _disk_path(cls, key):
+        return os.path.join(cls._disk_dir, key[:2], f"{key}.npy")
+
+    @classmethod
+    def get(cls, key):
+        """Trả về tensor image_embeds (CPU) hoặc None"""
+        with cls._lock:
+            tensor = cls._entries.get(key)
+            if tensor is not None:
+                cls._entries.move_to_end(key)
+                cls._counters["memory_hits"] += 1
+                return tensor
+
+        if cls._disk_dir and os.path.exists(cls._disk_path(key)):
+            import numpy as np
+            import torch
+
+            try:
+                array = np.load(cls._disk_path(key), mmap_mode="r")
+                # Đánh dấu vừa được dùng để không bị xóa trước các file cũ hơn
+                os.utime(cls._disk_path(key))
+                with warnings.catch_warnings():
+                    # Mảng memory-map chỉ đọc, tensor chỉ được dùng để đọc nên bỏ qua cảnh báo
+                    warnings.simplefilter("ignore")
+                    tensor = torch.from_numpy(array)
+            except Exception as e:
+                print(f"⚠️ Lỗi khi đọc embedding cache trên đĩa: {e}")
+            else:
+                cls._put_memory(key, tensor)
+                with cls._lock:
+                    cls._counters["disk_hits"] += 1
+                return tensor
+
+        with cls._lock:
+            cls._counters["misses"] += 1
+        return None
+
+    @classmethod
+    def contains(cls, key):
+        """Kiểm tra nhanh (không tính vào thống kê hit/miss)"""
+        with cls._lock:
+            if key in cls._entries:
+                return True
+        return bool(cls._disk_dir) and os.path.exists(cls._disk_path(key))
+
+    @classmethod
+    def put(cls, key, tensor):
+        tensor = tensor.detach().cpu().contiguous()
+        cls._put_memory(key, tensor)
+
+        if cls._disk_dir:
+            import numpy as np
+
+            path = cls._disk_path(key)
+            if not os.path.exists(path):
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+                    np.save(temp_path, tensor.numpy())
+                    os.replace(temp_path, path)
+                    cls._track_disk(os.path.getsize(path))
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi ghi embedding cache xuống đĩa: {e}")
+
+    @classmethod
+    def _scan_disk(cls):
+        """Danh sách (mtime, kích thước, đường dẫn) của các file cache trên đĩa"""
+        files = []
+        for root, _, names in os.walk(cls._disk_dir):
+            for name in names:
+                if not name.endswith(".npy") or ".tmp." in name:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Đã bị tiến trình khác xóa
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    @classmethod
+    def _track_disk(cls, size):
+        """Cộng dung lượng vừa ghi, dọn bớt file cũ nhất khi vượt quá EMBEDDING_CACHE_DISK_MAX_MB"""
+        with cls._disk_lock:
+            if cls._disk_bytes is None:
+                cls._disk_bytes = sum(file_size for _, file_size, _ in cls._scan_disk())
+            else:
+                cls._disk_bytes += size
+            if cls._disk_bytes <= cls._disk_max_bytes:
+                return
+
+            # Quét lại vì các tiến trình khác có thể cũng ghi vào cùng thư mục
+            files = sorted(cls._scan_disk())
+            total = sum(file_size for _, file_size, _ in files)
+            target = cls._disk_max_bytes * cls.DISK_EVICT_RATIO
+            for _, file_size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= file_size
+            cls._disk_bytes = total
+
+    @classmethod
+    def _put_memory(cls, key, tensor):
+        size = tensor.element_size() * tensor.nelement()
+        if size > cls._max_bytes:
+            return
+        with cls._lock:
+            previous = cls._entries.pop(key, None)
+            if previous is not None:
+                cls._total_bytes -= previous.element_size() * previous.nelement()
+            cls._entries[key] = tensor
+            cls._total_bytes += size
+            while cls._total_bytes > cls._max_bytes:
+                _, evicted = cls._entries.popitem(last=False)
+                cls._total_bytes -= evicted.element_size() * evicted.nelement()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._total_bytes = 0
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            stats = dict(cls._counters)
+            stats["memory_entries"] = len(cls._entries)
+            stats["memory_mb"] = round(cls._total_bytes / (1024 * 1024), 2)
+        stats["disk_enabled"] = bool(cls._disk_dir)
+        if cls._disk_bytes is not None:
+            stats["disk_mb"] = round(cls._disk_bytes / (1024 * 1024), 2)
+        return stats
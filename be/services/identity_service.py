@@ -0,0 +1,87 @@
+# services/identity_service.py
+from models.user import User
+from services.caption_cache import LRUCache
+from flask_jwt_extended import get_jwt, get_jwt_identity
+import threading
+import time
+import os
+
+class IdentityService:
+    """
+    Xác định vai trò và trạng thái hoạt động của người dùng đang gọi API mà không truy vấn MongoDB mỗi request.
+    - Token đăng nhập mang sẵn role/is_active trong additional claims (đã được ký).
+      Claims chỉ được tin trong IDENTITY_CLAIMS_MAX_AGE_SECONDS đầu tiên của token.
+    - Token cũ hơn dùng cache trong tiến trình, hết hạn sau IDENTITY_CACHE_TTL_SECONDS.
+    - Khi vai trò/trạng thái thay đổi (UserService), cache bị xóa và claims phát hành trước đó bị bỏ qua
+      trong tiến trình hiện tại. Các tiến trình khác thấy thay đổi sau tối đa thời gian của hai giới hạn trên.
+    """
+
+    _ttl = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", 30))
+    _claims_max_age = float(os.getenv("IDENTITY_CLAIMS_MAX_AGE_SECONDS", 300))
+
+    # user_id -> (hết hạn lúc, identity), giữ tối đa IDENTITY_CACHE_SIZE người dùng gần nhất
+    _cache = LRUCache(int(os.getenv("IDENTITY_CACHE_SIZE", 10000)))
+    # user_id -> thời điểm vai trò/trạng thái thay đổi gần nhất, chỉ cần giữ trong IDENTITY_CLAIMS_MAX_AGE_SECONDS
+    _changed_at = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def claims_for(user):
+        """Claims bổ sung đưa vào access token khi đăng nhập"""
+        return {"role": user.role, "is_active": user.is_active}
+
+    @classmethod
+    def _from_claims(cls, user_id, claims):
+        if "role" not in claims or "is_active" not in claims:
+            return None
+        issued_at = claims.get("iat", 0)
+        if time.time() - issued_at > cls._claims_max_age:
+            return None
+        with cls._lock:
+            if issued_at <= cls._changed_at.get(user_id, 0):
+                return None
+        return {"role": claims["role"], "is_active": claims["is_active"]}
+
+    @classmethod
+    def get_identity(cls, user_id):
+        """Trả về {"role", "is_active"} của người dùng (từ cache hoặc MongoDB), None nếu không tồn tại"""
+        now = time.monotonic()
+        cached = cls._cache.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        user = User.objects(id=user_id).only('role', 'is_active').first()
+        identity = {"role": user.role, "is_active": user.is_active} if user else None
+        cls._cache.put(user_id, (now + cls._ttl, identity))
+        return identity
+
+    @classmethod
+    def current_identity(cls):
+        """Identity của người dùng trong JWT hiện tại (gọi sau jwt_required)"""
+        user_id = get_jwt_identity()
+        if not user_id:
+            return None
+        return cls._from_claims(user_id, get_jwt()) or cls.get_identity(user_id)
+
+    @classmethod
+    def is_admin(cls):
+        identity = cls.current_identity()
+        return bool(identity) and identity["is_active"] and identity["role"] == "admin"
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Gọi sau khi vai trò/trạng thái của người dùng thay đổi"""
+        user_id = str(user_id)
+        now = time.time()
+        cls._cache.pop(user_id)
+        with cls._lock:
+            # Claims phát hành trước một thay đổi cũ hơn IDENTITY_CLAIMS_MAX_AGE_SECONDS đã hết được tin,
+            # không cần giữ lại thời điểm thay đổi đó
+            for changed_user, changed_at in list(cls._changed_at.items()):
+                if now - changed_at > cls._claims_max_age:
+                    del cls._changed_at[changed_user]
+            cls._changed_at[user_id] = now
+
+    @classmethod
+    def clear(cls):
+        cls._cache.clear()
@@ -3,18 +3,23 @@ import torch
 from transformers import BlipProcessor, BlipForConditionalGeneration
 from PIL import Image
 import os
-from googletrans import Translator
-from gtts import gTTS
-import tempfile
-import playsound
-import io
+import threading
+import hashlib
+import time
+from concurrent.futures import Future
+from services.caption_batcher import CaptionBatcher
+from services.caption_cache import CaptionCache
+from services.model_optimization import prepare_model
+from services.embedding_cache import EmbeddingCache
+from services.image_preprocessing import ImagePreprocessor
+from services.stats_service import StatsService
 
 class ImageCaptionService:
     """
     Lớp này chịu trách nhiệm:
     - Load mô hình BLIP và Processor từ local (một lần duy nhất).
     - Cung cấp hàm generate_caption() nhận file ảnh từ controller, trả về chuỗi caption.
-    - Nếu bật speak=True: dịch chú thích sang tiếng Việt và phát âm thanh.
+    Việc dịch và đọc caption được tách sang SpeechService, chạy bất đồng bộ.
     """
 
     _model = None
@@ -26,111 +31,546 @@ class ImageCaptionService:
     parent_dir = os.path.abspath(os.path.join(current_dir, ".."))
     _model_path = os.path.join(parent_dir, "pretrain", "blip_trained")
 
-    _is_loading = False
-    _translator = Translator()  # Tái sử dụng translator
+    # Khóa bảo vệ việc tải mô hình: chỉ một luồng tải, các luồng khác chờ trên khóa
+    _load_lock = threading.Lock()
+    _warm_up_state = None  # None | "running" | "done" | "failed"
+    _warm_up_error = None
+
+    # Cấu hình gom batch động
+    _batching_enabled = os.getenv("CAPTION_BATCHING", "true").lower() == "true"
+    _max_batch_size = int(os.getenv("CAPTION_MAX_BATCH_SIZE", 8))
+    _batch_wait_ms = float(os.getenv("CAPTION_BATCH_WAIT_MS", 20))
+    _batcher = None
+    _batcher_lock = threading.Lock()
+
+    _model_revision = os.getenv("CAPTION_MODEL_REVISION")
+
+    # Các profile giải mã: fast (greedy), balanced, quality (beam search như mặc định trước đây)
+    DECODING_PROFILES = {
+        "fast": {"max_length": 20, "num_beams": 1, "min_length": 5},
+        "balanced": {"max_length": 30, "num_beams": 3, "min_length": 5},
+        "quality": {"max_length": 30, "num_beams": 5, "min_length": 5}
+    }
+    # Thứ tự từ chất lượng cao đến rẻ nhất, dùng khi tự chọn profile
+    _profile_order = ("quality", "balanced", "fast")
+    _default_profile = os.getenv("CAPTION_DEFAULT_PROFILE", "quality")
+    # Ngưỡng số yêu cầu đang chờ hoặc đang chạy (trong process này) để tự hạ xuống balanced/fast
+    _auto_balanced_depth = int(os.getenv("CAPTION_AUTO_BALANCED_DEPTH", 4))
+    _auto_fast_depth = int(os.getenv("CAPTION_AUTO_FAST_DEPTH", 16))
+    # Độ trễ ước lượng (ms) cho mỗi bộ tham số, cập nhật dần bằng trung bình trượt (EWMA) từ độ trễ đầu-cuối
+    # thực tế (đã gồm thời gian chờ trong batcher/pool nên không nhân thêm theo độ dài hàng đợi)
+    _latency_estimates = {
+        (20, 1): 300.0,
+        (30, 3): 800.0,
+        (30, 5): 1200.0
+    }
+    _latency_lock = threading.Lock()
+    # Số yêu cầu đang chạy suy luận, đếm ở mọi chế độ (batching, không batching, pool suy luận)
+    _in_flight = 0
+
+    # Chế độ suy luận: fp32, int8, onnx, onnx-int8 (xem services/model_optimization.py)
+    _inference_mode = os.getenv("CAPTION_INFERENCE_MODE", "fp32").lower()
+    _vision_encoder = None
+
+    # Nếu cấu hình, việc suy luận được chuyển sang pool tiến trình riêng (services/inference_pool.py)
+    _inference_address = os.getenv("INFERENCE_SERVER_ADDRESS")
+    _inference_client = None
 
     @classmethod
     def _load_model_if_needed(cls):
-        if cls._model is None or cls._processor is None:
-            if cls._is_loading:
-                import time
-                while cls._is_loading and (cls._model is None or cls._processor is None):
-                    time.sleep(0.5)
-                return
-
-            cls._is_loading = True
-            try:
-                if not os.path.exists(cls._model_path):
-                    raise FileNotFoundError(f"Không tìm thấy đường dẫn mô hình: {cls._model_path}")
+        """
+        Tải mô hình một lần duy nhất (idempotent, an toàn luồng).
+        Trả về (processor, model) để người gọi dùng nhất quán kể cả khi mô hình bị giải phóng song song.
+        """
+        processor, model = cls._processor, cls._model
+        if processor is not None and model is not None:
+            return processor, model
+
+        with cls._load_lock:
+            # Kiểm tra lại sau khi có khóa: luồng khác có thể đã tải xong
+            if cls._processor is not None and cls._model is not None:
+                return cls._processor, cls._model
+
+            if not os.path.exists(cls._model_path):
+                raise FileNotFoundError(f"Không tìm thấy đường dẫn mô hình: {cls._model_path}")
 
-                print(f"Đang tải mô hình BLIP từ {cls._model_path}...")
-                cls._processor = BlipProcessor.from_pretrained(cls._model_path, use_fast=True)
-                cls._model = BlipForConditionalGeneration.from_pretrained(cls._model_path)
-                cls._model = cls._model.to(cls._device)
-                cls._model.eval()
-                print(f"Tải mô hình thành công trên thiết bị {cls._device}")
-            finally:
-                cls._is_loading = False
+            print(f"Đang tải mô hình BLIP từ {cls._model_path}...")
+            processor = BlipProcessor.from_pretrained(cls._model_path, use_fast=True)
+            model = BlipForConditionalGeneration.from_pretrained(cls._model_path)
+            model = model.to(cls._device)
+            model.eval()
+            model, vision_encoder = prepare_model(
+                model, cls._inference_mode, cls._model_path, model.config.vision_config.image_size, cls._device
+            )
+
+            # Gán processor trước, model sau cùng: model khác None nghĩa là đã tải xong
+            cls._processor = processor
+            cls._vision_encoder = vision_encoder
+            cls._model = model
+            print(f"Tải mô hình thành công trên thiết bị {cls._device} (chế độ {cls._inference_mode})")
+            return processor, model
 
     @classmethod
     def unload_model(cls):
-        if cls._model is not None:
-            cls._model = None
-            cls._processor = None
-            import gc
-            gc.collect()
-            if cls._device == "cuda":
-                torch.cuda.empty_cache()
-            print("Đã giải phóng mô hình khỏi bộ nhớ")
+        with cls._load_lock:
+            if cls._model is not None:
+                cls._model = None
+                cls._processor = None
+                cls._vision_encoder = None
+                EmbeddingCache.clear()
+                import gc
+                gc.collect()
+                if cls._device == "cuda":
+                    torch.cuda.empty_cache()
+                print("Đã giải phóng mô hình khỏi bộ nhớ")
+
+    @classmethod
+    def is_model_loaded(cls):
+        return cls._model is not None and cls._processor is not None
 
     @classmethod
-    def speak_caption(cls, text_en):
+    def _get_inference_client(cls):
+        if cls._inference_client is None:
+            from services.inference_pool import InferenceClient
+            cls._inference_client = InferenceClient(cls._inference_address)
+        return cls._inference_client
+
+    @classmethod
+    def is_ready(cls):
+        """Sẵn sàng nhận request: mô hình đã tải và không còn đang warm-up (hoặc inference server phản hồi)"""
+        if cls._inference_address:
+            return cls._get_inference_client().ping()
+        return cls.is_model_loaded() and cls._warm_up_state != "running"
+
+    @classmethod
+    def warm_up(cls):
+        """Tải mô hình và chạy một lần suy luận giả để khởi tạo kernel/bộ nhớ đệm"""
+        cls._warm_up_state = "running"
+        if cls._inference_address:
+            # Mô hình nằm ở inference server, web worker không tải mô hình
+            cls._warm_up_state = "done"
+            return
+        try:
+            dummy = Image.new("RGB", (384, 384), color=(127, 127, 127))
+            cls._generate_batch([dummy], max_length=10, num_beams=1, min_length=1)
+            cls._warm_up_state = "done"
+            print("Warm-up mô hình hoàn tất")
+        except Exception as e:
+            cls._warm_up_state = "failed"
+            cls._warm_up_error = str(e)
+            print(f"⚠️ Warm-up mô hình thất bại: {e}")
+
+    @classmethod
+    def start_warm_up(cls):
+        """Warm-up trong thread nền để không chặn quá trình khởi động app"""
+        cls._warm_up_state = "running"
+        thread = threading.Thread(target=cls.warm_up, name="caption-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def get_readiness(cls):
+        return {
+            "ready": cls.is_ready(),
+            "inference_server": cls._inference_address,
+            "model_loaded": cls.is_model_loaded(),
+            "warm_up": cls._warm_up_state,
+            "warm_up_error": cls._warm_up_error,
+            "device": cls._device,
+            "inference_mode": cls._inference_mode
+        }
+
+    @classmethod
+    def _get_batcher(cls):
+        if cls._batcher is None:
+            with cls._batcher_lock:
+                if cls._batcher is None:
+                    cls._batcher = CaptionBatcher(
+                        cls._caption_payloads,
+                        max_batch_size=cls._max_batch_size,
+                        max_wait_ms=cls._batch_wait_ms
+                    )
+        return cls._batcher
+
+    @classmethod
+    def _encode_images(cls, model, vision_encoder, pixel_values):
+        """Chạy vision encoder (PyTorch hoặc ONNX Runtime), trả về image_embeds"""
+        if vision_encoder is not None:
+            return vision_encoder(pixel_values).to(cls._device)
+        return model.vision_model(pixel_values=pixel_values)[0]
+
+    @classmethod
+    def _decode_captions(cls, processor, model, image_embeds, max_length=30, num_beams=5, min_length=5, streamer=None):
         """
-        Dịch văn bản tiếng Anh sang tiếng Việt và phát âm.
+        Chạy text decoder trên image_embeds (tương đương phần sau của BlipForConditionalGeneration.generate).
+        streamer (chỉ dùng với batch 1 ảnh và num_beams=1) nhận từng token ngay khi được sinh ra.
         """
-        try:
-            translation = cls._translator.translate(text_en, src='en', dest='vi')
-            caption_vi = translation.text
-            print("🔁 Dịch sang tiếng Việt:", caption_vi)
+        text_config = model.config.text_config
+        batch_size = image_embeds.size(0)
+        image_attention_mask = torch.ones(image_embeds.size()[:-1], dtype=torch.long, device=image_embeds.device)
+        input_ids = torch.full((batch_size, 1), text_config.bos_token_id, dtype=torch.long, device=image_embeds.device)
 
-            tts = gTTS(caption_vi, lang='vi')
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                temp_path = fp.name
-                tts.save(temp_path)
+        output_ids = model.text_decoder.generate(
+            input_ids=input_ids,
+            eos_token_id=text_config.sep_token_id,
+            pad_token_id=text_config.pad_token_id,
+            encoder_hidden_states=image_embeds,
+            encoder_attention_mask=image_attention_mask,
+            max_length=max_length,
+            num_beams=num_beams,
+            min_length=min_length,
+            streamer=streamer
+        )
+        return processor.batch_decode(output_ids, skip_special_tokens=True)
 
-            try:
-                playsound.playsound(temp_path)
-            except Exception:
-                os.system(f"start {temp_path}")
-            finally:
-                os.remove(temp_path)
-        except Exception as e:
-            print(f"⚠️ Lỗi khi đọc caption: {e}")
+    @classmethod
+    def _generate_batch(cls, images, max_length=30, num_beams=5, min_length=5):
+        """
+        Chạy một lần suy luận cho cả batch ảnh PIL, trả về danh sách caption theo thứ tự.
+        """
+        processor, model = cls._load_model_if_needed()
+        vision_encoder = cls._vision_encoder
+
+        # BlipProcessor resize mọi ảnh về cùng kích thước nên có thể xếp chồng thành một tensor
+        inputs = processor(images=images, return_tensors="pt")
+        pixel_values = inputs["pixel_values"].to(cls._device)
+
+        with torch.no_grad():
+            image_embeds = cls._encode_images(model, vision_encoder, pixel_values)
+            return cls._decode_captions(
+                processor, model, image_embeds,
+                max_length=max_length, num_beams=num_beams, min_length=min_length
+            )
+
+    @classmethod
+    def _image_size(cls):
+        """Kích thước đầu vào của vision encoder (None nếu mô hình chưa được tải: dùng mặc định của ImagePreprocessor)"""
+        model = cls._model
+        return model.config.vision_config.image_size if model is not None else None
 
     @classmethod
-    def generate_caption_from_binary(cls, image_data, max_length=30, num_beams=5, speak=False):
+    def _caption_payloads(cls, payloads, max_length=30, num_beams=5, min_length=5):
         """
-        Tạo caption cho ảnh từ dữ liệu nhị phân.
-        Nếu speak=True, sẽ dịch caption sang tiếng Việt và phát tiếng.
+        Tạo caption cho một batch (content_hash, image_data), image_data là bytes hoặc Future từ ImagePreprocessor.
+        image_embeds được lấy từ EmbeddingCache nếu có, chỉ ảnh chưa có mới được giải mã và chạy vision encoder.
+        Trả về danh sách caption hoặc Exception (cho ảnh lỗi) theo đúng thứ tự.
         """
-        try:
-            cls._load_model_if_needed()
+        processor, model = cls._load_model_if_needed()
+        vision_encoder = cls._vision_encoder
+        revision = cls.model_revision()
+
+        results = [None] * len(payloads)
+        embeds = [None] * len(payloads)
+        pending = {}
+        for i, (content_hash, image_data) in enumerate(payloads):
+            embeds[i] = EmbeddingCache.get(EmbeddingCache.make_key(content_hash, revision))
+            if embeds[i] is None:
+                # Giải mã song song trong pool tiền xử lý (payload có thể đã được submit từ trước)
+                pending[i] = image_data if isinstance(image_data, Future) else ImagePreprocessor.submit(
+                    image_data, model.config.vision_config.image_size
+                )
 
-            # Chuyển dữ liệu nhị phân thành đối tượng PIL Image
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
-            inputs = cls._processor(image, return_tensors="pt")
-            for k, v in inputs.items():
-                inputs[k] = v.to(cls._device)
+        missing, images = [], []
+        for i, future in pending.items():
+            try:
+                images.append(future.result())
+                missing.append(i)
+            except ValueError as e:
+                results[i] = e
 
-            with torch.no_grad():
-                output_ids = cls._model.generate(
-                    **inputs,
-                    max_length=max_length,
-                    num_beams=num_beams,
-                    min_length=5
+        with torch.no_grad():
+            if missing:
+                inputs = processor(images=images, return_tensors="pt")
+                new_embeds = cls._encode_images(model, vision_encoder, inputs["pixel_values"].to(cls._device))
+                for j, i in enumerate(missing):
+                    embeds[i] = new_embeds[j]
+                    EmbeddingCache.put(EmbeddingCache.make_key(payloads[i][0], revision), new_embeds[j])
+
+            ready = [i for i, embed in enumerate(embeds) if embed is not None]
+            if ready:
+                image_embeds = torch.stack([embeds[i].to(cls._device) for i in ready])
+                captions = cls._decode_captions(
+                    processor, model, image_embeds,
+                    max_length=max_length, num_beams=num_beams, min_length=min_length
                 )
+                for i, caption in zip(ready, captions):
+                    results[i] = caption
 
-            caption_en = cls._processor.decode(output_ids[0], skip_special_tokens=True)
-            print("📸 Caption tiếng Anh:", caption_en)
+        return results
+
+    @classmethod
+    def model_revision(cls):
+        """
+        Phiên bản mô hình dùng làm một phần khóa cache caption.
+        Lấy từ CAPTION_MODEL_REVISION, nếu không có thì tính từ config và tên/kích thước file trọng số.
+        """
+        if cls._model_revision is None:
+            digest = hashlib.sha256()
+            if os.path.isdir(cls._model_path):
+                for name in sorted(os.listdir(cls._model_path)):
+                    path = os.path.join(cls._model_path, name)
+                    if name == "config.json":
+                        with open(path, "rb") as f:
+                            digest.update(f.read())
+                    elif os.path.isfile(path):
+                        digest.update(f"{name}:{os.path.getsize(path)}".encode("utf-8"))
+            cls._model_revision = digest.hexdigest()[:12]
+            # Các chế độ lượng tử hóa có thể cho caption khác fp32 nên không dùng chung cache
+            if cls._inference_mode != "fp32":
+                cls._model_revision = f"{cls._model_revision}-{cls._inference_mode}"
+        return cls._model_revision
 
-            if speak:
-                cls.speak_caption(caption_en)
+    @classmethod
+    def get_decoding_profiles(cls):
+        return {
+            "default": cls._default_profile,
+            "profiles": {
+                name: dict(params, estimated_latency_ms=round(cls._estimate_latency_ms(params), 1))
+                for name, params in cls.DECODING_PROFILES.items()
+            }
+        }
+
+    @classmethod
+    def get_metrics(cls):
+        """Thống kê batch size, thời gian chờ của bộ gom batch và hit/miss của cache caption"""
+        if cls._batcher is None:
+            metrics = {"batching_enabled": cls._batching_enabled, "queue_depth": 0}
+        else:
+            metrics = cls._batcher.metrics.snapshot()
+            metrics["batching_enabled"] = cls._batching_enabled
+            metrics["queue_depth"] = cls._batcher.queue_depth()
+        metrics["in_flight"] = cls.queue_depth()
+        if cls._inference_address:
+            try:
+                metrics["inference_workers"] = cls._get_inference_client().metrics()
+            except Exception as e:
+                metrics["inference_workers"] = {"error": str(e)}
+        metrics["cache"] = CaptionCache.stats()
+        metrics["embedding_cache"] = EmbeddingCache.stats()
+        return metrics
+
+    @classmethod
+    def queue_depth(cls):
+        """Số yêu cầu tạo caption đang chờ hoặc đang chạy trong process này (không tính cache hit)"""
+        with cls._latency_lock:
+            return cls._in_flight
+
+    @classmethod
+    def _track_in_flight(cls, delta):
+        with cls._latency_lock:
+            cls._in_flight += delta
+
+    @classmethod
+    def _estimate_latency_ms(cls, params):
+        """Độ trễ ước lượng (EWMA của độ trễ đầu-cuối gần đây, đã phản ánh tải hiện tại) của một bộ tham số"""
+        with cls._latency_lock:
+            base = cls._latency_estimates.get((params["max_length"], params["num_beams"]))
+            if base is None:
+                base = max(cls._latency_estimates.values())
+        return base
+
+    @classmethod
+    def _record_latency(cls, params, elapsed_ms, alpha=0.2):
+        key = (params["max_length"], params["num_beams"])
+        with cls._latency_lock:
+            previous = cls._latency_estimates.get(key)
+            cls._latency_estimates[key] = elapsed_ms if previous is None else (1 - alpha) * previous + alpha * elapsed_ms
+
+    @classmethod
+    def choose_profile(cls, latency_budget_ms=None):
+        """
+        Tự chọn profile:
+        - Có ngân sách độ trễ: profile chất lượng cao nhất có độ trễ ước lượng nằm trong ngân sách.
+        - Không có: dựa vào số yêu cầu đang chờ, hàng đợi càng dài càng dùng giải mã rẻ hơn.
+        """
+        if latency_budget_ms is not None:
+            for name in cls._profile_order:
+                if cls._estimate_latency_ms(cls.DECODING_PROFILES[name]) <= latency_budget_ms:
+                    return name
+            return cls._profile_order[-1]
+
+        depth = cls.queue_depth()
+        if depth >= cls._auto_fast_depth:
+            return "fast"
+        if depth >= cls._auto_balanced_depth:
+            return "balanced"
+        return cls._default_profile
+
+    @classmethod
+    def resolve_decoding(cls, profile=None, latency_budget_ms=None, max_length=None, num_beams=None, min_length=None):
+        """
+        Xác định profile và tham số sinh cuối cùng.
+        profile="auto" hoặc có latency_budget_ms thì server tự chọn; tham số truyền trực tiếp ghi đè profile.
+        Trả về (tên profile, params).
+        """
+        if latency_budget_ms is not None or profile == "auto":
+            profile = cls.choose_profile(latency_budget_ms)
+        profile = profile or cls._default_profile
+        if profile not in cls.DECODING_PROFILES:
+            raise ValueError(f"Profile không hợp lệ: {profile}. Các profile hợp lệ: auto, {', '.join(cls.DECODING_PROFILES)}")
+
+        params = dict(cls.DECODING_PROFILES[profile])
+        overrides = {"max_length": max_length, "num_beams": num_beams, "min_length": min_length}
+        for key, value in overrides.items():
+            if value is not None:
+                params[key] = int(value)
+        return profile, params
+
+    @classmethod
+    def generate_caption_from_binary(cls, image_data, max_length=None, num_beams=None, content_hash=None,
+                                     profile=None, latency_budget_ms=None, min_length=None):
+        """
+        Tạo caption cho ảnh từ dữ liệu nhị phân.
+        Tham số sinh lấy từ profile giải mã (fast/balanced/quality/auto), có thể ghi đè từng tham số.
+        Kết quả được cache theo hash ảnh và tham số sinh, nên ảnh trùng không phải chạy lại mô hình.
+        Các yêu cầu đồng thời được gom thành batch trước khi đưa vào mô hình.
+        """
+        try:
+            _, params = cls.resolve_decoding(profile, latency_budget_ms, max_length, num_beams, min_length)
+            content_hash = content_hash or hashlib.sha256(image_data).hexdigest()
+            cache_key = CaptionCache.make_key(content_hash, cls.model_revision(), **params)
+
+            caption_en = CaptionCache.get(cache_key)
+            if caption_en is None:
+                cls._track_in_flight(1)
+                try:
+                    caption_en = cls._run_inference(image_data, content_hash, params)
+                finally:
+                    cls._track_in_flight(-1)
+                CaptionCache.put(cache_key, caption_en)
+                StatsService.record_captions()
+            print("📸 Caption tiếng Anh:", caption_en)
 
             return caption_en
 
         except Exception as e:
             print(f"Lỗi khi tạo caption: {e}")
             raise
-            
+
+    @classmethod
+    def _run_inference(cls, image_data, content_hash, params):
+        """Chạy mô hình cho một ảnh (pool suy luận, bộ gom batch hoặc trực tiếp) và ghi nhận độ trễ"""
+        started = time.perf_counter()
+        if cls._inference_address:
+            # Pool tiến trình suy luận tự giải mã ảnh và gom batch
+            caption_en = cls._get_inference_client().caption(image_data, content_hash=content_hash, **params)
+        else:
+            # Ảnh chỉ được giải mã nếu chưa có image_embeds trong cache
+            payload = (content_hash, image_data)
+            if cls._batching_enabled:
+                if not EmbeddingCache.contains(EmbeddingCache.make_key(content_hash, cls.model_revision())):
+                    # Giải mã ngay trong pool tiền xử lý, chồng lên batch đang chạy trên mô hình
+                    payload = (content_hash, ImagePreprocessor.submit(image_data, cls._image_size()))
+                caption_en = cls._get_batcher().submit(payload, **params).result()
+            else:
+                caption_en = cls._caption_payloads([payload], **params)[0]
+                if isinstance(caption_en, Exception):
+                    raise caption_en
+        cls._record_latency(params, (time.perf_counter() - started) * 1000)
+        return caption_en
+
+    @classmethod
+    def _image_embeds(cls, processor, model, content_hash, image_data):
+        """image_embeds (batch 1) của một ảnh, lấy từ EmbeddingCache nếu có"""
+        key = EmbeddingCache.make_key(content_hash, cls.model_revision())
+        embeds = EmbeddingCache.get(key)
+        if embeds is None:
+            image = ImagePreprocessor.submit(image_data, model.config.vision_config.image_size).result()
+            inputs = processor(images=[image], return_tensors="pt")
+            with torch.no_grad():
+                embeds = cls._encode_images(model, cls._vision_encoder, inputs["pixel_values"].to(cls._device))[0]
+            EmbeddingCache.put(key, embeds)
+        return embeds.unsqueeze(0).to(cls._device)
+
+    @classmethod
+    def stream_caption(cls, image_data, content_hash=None, profile=None, latency_budget_ms=None,
+                       max_length=None, num_beams=None, min_length=None):
+        """
+        Tạo caption và trả về (generator) các sự kiện (tên, dữ liệu) theo từng giai đoạn:
+        preprocessed -> decoding -> token (chỉ khi giải mã greedy, num_beams=1) -> caption.
+        Beam search và chế độ pool suy luận vẫn có preprocessed và decoding nhưng không sinh token từng phần.
+        Ở chế độ pool, ảnh được tiền xử lý trong tiến trình suy luận nên preprocessed mang {"remote": True}.
+        Caption lấy từ CaptionCache chỉ có sự kiện caption.
+        """
+        profile, params = cls.resolve_decoding(profile, latency_budget_ms, max_length, num_beams, min_length)
+        content_hash = content_hash or hashlib.sha256(image_data).hexdigest()
+        cache_key = CaptionCache.make_key(content_hash, cls.model_revision(), **params)
+
+        caption_en = CaptionCache.get(cache_key)
+        if caption_en is not None:
+            yield "caption", {"description": caption_en, "profile": profile, "cached": True}
+            return
+
+        streaming = params["num_beams"] == 1 and not cls._inference_address
+        if not streaming:
+            if cls._inference_address:
+                yield "preprocessed", {"remote": True}
+            else:
+                # Đưa image_embeds vào EmbeddingCache để lần sinh caption bên dưới không phải chạy lại vision encoder
+                processor, model = cls._load_model_if_needed()
+                cls._image_embeds(processor, model, content_hash, image_data)
+                yield "preprocessed", {}
+            yield "decoding", {"profile": profile, "streaming": False}
+            caption_en = cls.generate_caption_from_binary(image_data, content_hash=content_hash, **params)
+            yield "caption", {"description": caption_en, "profile": profile, "cached": False}
+            return
+
+        from transformers import TextIteratorStreamer
+
+        started = time.perf_counter()
+        cls._track_in_flight(1)
+        try:
+            processor, model = cls._load_model_if_needed()
+            image_embeds = cls._image_embeds(processor, model, content_hash, image_data)
+            yield "preprocessed", {}
+
+            streamer = TextIteratorStreamer(
+                processor.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=60
+            )
+            outcome = {}
+
+            def run():
+                # no_grad chỉ có hiệu lực trong luồng hiện tại nên phải đặt trong luồng sinh token
+                try:
+                    with torch.no_grad():
+                        outcome["captions"] = cls._decode_captions(
+                            processor, model, image_embeds, streamer=streamer, **params
+                        )
+                except Exception as e:
+                    outcome["error"] = e
+                    streamer.end()
+
+            thread = threading.Thread(target=run, name="caption-stream", daemon=True)
+            thread.start()
+            yield "decoding", {"profile": profile, "streaming": True}
+            for text in streamer:
+                if text:
+                    yield "token", {"text": text}
+            thread.join()
+
+            if "error" in outcome:
+                raise outcome["error"]
+        finally:
+            cls._track_in_flight(-1)
+
+        caption_en = outcome["captions"][0]
+        StatsService.record_captions()
+        CaptionCache.put(cache_key, caption_en)
+        cls._record_latency(params, (time.perf_counter() - started) * 1000)
+        yield "caption", {"description": caption_en, "profile": profile, "cached": False}
+
     @classmethod
-    def generate_caption_from_image_id(cls, image_id, max_length=30, num_beams=5, speak=False):
+    def generate_caption_from_image_id(cls, image_id, max_length=None, num_beams=None):
         """
         Tạo caption cho ảnh từ ID của ảnh trong MongoDB.
         """
         from models.image import Image
+        from services.image_service import ImageService
         
         image_doc = Image.objects(id=image_id).first()
         if not image_doc:
             raise ValueError("Không tìm thấy ảnh với ID cung cấp")
             
-        return cls.generate_caption_from_binary(image_doc.image_data, max_length, num_beams, speak)
\ No newline at end of file
+        return cls.generate_caption_from_binary(
+            ImageService.read_image_data(image_doc), max_length, num_beams, content_hash=image_doc.content_hash
+        )
\ No newline at end of file
@@ -0,0 +1,73 @@
+# services/image_preprocessing.py
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage
+import io
+import os
+import warnings
+
+class ImagePreprocessor:
+    """
+    Giải mã và thu nhỏ ảnh trước khi đưa vào BLIP processor.
+    - JPEG được giải mã trực tiếp ở độ phân giải thấp bằng draft() (giảm tỉ lệ ngay trong bộ giải mã DCT).
+    - Ảnh có số pixel vượt IMAGE_MAX_PIXELS bị từ chối trước khi giải mã (chống decompression bomb).
+    - Chạy trong thread pool riêng (Pillow nhả GIL khi giải mã/resize), để việc giải mã chồng lên thời gian suy luận.
+    """
+
+    _max_pixels = int(os.getenv("IMAGE_MAX_PIXELS", 50_000_000))
+    # Kích thước đầu vào của vision encoder BLIP
+    _target_size = int(os.getenv("IMAGE_PREPROCESS_SIZE", 384))
+    _executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("IMAGE_PREPROCESS_WORKERS", 2)), thread_name_prefix="image-preprocess"
+    )
+
+    # Giới hạn chung của Pillow: vượt quá 2 lần sẽ ném DecompressionBombError
+    PILImage.MAX_IMAGE_PIXELS = _max_pixels
+
+    @classmethod
+    def check_size(cls, image):
+        """Từ chối ảnh có số pixel vượt giới hạn, chỉ dựa vào header nên chưa tốn bộ nhớ giải mã"""
+        width, height = image.size
+        if width * height > cls._max_pixels:
+            raise ValueError(f"Ảnh quá lớn ({width}x{height}), tối đa {cls._max_pixels} pixel")
+
+    @classmethod
+    def open(cls, data):
+        """Mở ảnh (chỉ đọc header) và kiểm tra giới hạn kích thước"""
+        try:
+            with warnings.catch_warnings():
+                # Coi cảnh báo decompression bomb là lỗi thay vì chỉ in cảnh báo
+                warnings.simplefilter("error", PILImage.DecompressionBombWarning)
+                image = PILImage.open(io.BytesIO(data))
+        except (PILImage.DecompressionBombWarning, PILImage.DecompressionBombError) as e:
+            raise ValueError(f"Ảnh quá lớn: {e}")
+        except Exception as e:
+            raise ValueError(f"Không đọc được dữ liệu ảnh: {e}")
+        cls.check_size(image)
+        return image
+
+    @classmethod
+    def preprocess(cls, data, size=None):
+        """
+        Giải mã ảnh từ bytes và resize về size x size (RGB).
+        BLIP processor cũng resize về đúng kích thước này, nên bước resize của processor không còn tốn kém.
+        """
+        size = size or cls._target_size
+        image = cls.open(data)
+        try:
+            if image.format == "JPEG":
+                # draft chọn tỉ lệ 1/2, 1/4, 1/8 lớn nhất vẫn giữ ảnh >= size theo cả hai chiều
+                image.draft("RGB", (size, size))
+            image = image.convert("RGB")
+            if image.size != (size, size):
+                # reducing_gap: thu nhỏ nhanh bằng reduce() trước rồi mới resample chính xác
+                image = image.resize((size, size), PILImage.BICUBIC, reducing_gap=3.0)
+            return image
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Không đọc được dữ liệu ảnh: {e}")
+
+    @classmethod
+    def submit(cls, data, size=None):
+        """Đưa việc giải mã vào thread pool, trả về Future chứa ảnh PIL"""
+        return cls._executor.submit(cls.preprocess, data, size)
@@ -2,46 +2,158 @@
 from models.image import Image
 from models.report import Report
 from models.user import User
+from services.blob_storage import get_blob_storage
+from services.thumbnail_service import ThumbnailService
+from services.stats_service import StatsService
+from services.pagination import paginate
+from services.text_search import text_query
+from services.caption_search_index import CaptionSearchIndex
+from bson import ObjectId
+from bson.errors import InvalidId
+import os
 import uuid
 from werkzeug.utils import secure_filename
-import io
-from flask import send_file
 
 class ImageService:
     
+    # Kích thước tối đa của một ảnh tải lên (MAX_UPLOAD_MB, mặc định 16MB)
+    MAX_UPLOAD_SIZE = int(float(os.getenv("MAX_UPLOAD_MB", 16)) * 1024 * 1024)
+    
+    # Chữ ký đầu file của các định dạng ảnh được chấp nhận
+    IMAGE_SIGNATURES = (
+        (b"\xff\xd8\xff", "image/jpeg"),
+        (b"\x89PNG\r\n\x1a\n", "image/png"),
+        (b"GIF87a", "image/gif"),
+        (b"GIF89a", "image/gif")
+    )
+    
+    @staticmethod
+    def sniff_mime_type(head):
+        """Nhận dạng loại ảnh từ các byte đầu, không tin vào Content-Type do client gửi"""
+        for signature, mime_type in ImageService.IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return mime_type
+        raise ValueError("Nội dung file không phải ảnh hợp lệ")
+    
     @staticmethod
     def upload_image(file, description, user_id):
-        """Tải lên hình ảnh mới vào MongoDB"""
+        """
+        Tải lên hình ảnh mới: dữ liệu vào kho blob, metadata vào MongoDB.
+        Ảnh được đọc theo từng chunk (băm, kiểm tra kích thước và định dạng trong lúc ghi),
+        không bao giờ nằm trọn trong bộ nhớ.
+        """
+        user = User.objects(id=user_id).first()
+        return ImageService.store_image(file.stream, file.filename, description, user)
+    
+    @staticmethod
+    def store_image(stream, filename, description, user):
+        """Lưu ảnh từ một stream bất kỳ (file upload, mục trong file zip...) cho người dùng đã biết"""
         # Tạo tên tệp duy nhất
-        filename = secure_filename(file.filename)
+        filename = secure_filename(filename)
         unique_filename = f"{uuid.uuid4()}_{filename}"
         
-        # Đọc dữ liệu nhị phân từ file
-        file_data = file.read()
+        # Ghi dữ liệu vào kho blob theo từng chunk
+        content_hash, size, content_type = get_blob_storage().put_stream(
+            stream,
+            max_size=ImageService.MAX_UPLOAD_SIZE,
+            validate=ImageService.sniff_mime_type
+        )
         
         # Tạo bản ghi hình ảnh
-        user = User.objects(id=user_id).first()
         image = Image(
             description=description,
             file_name=unique_filename,
-            content_type=file.content_type,
-            image_data=file_data,
+            content_type=content_type,
+            content_hash=content_hash,
+            size=size,
             uploaded_by=user
         )
         image.save()
+        StatsService.record_image_uploaded()
+        
+        # Sinh thumbnail trong nền
+        ThumbnailService.schedule_variants(image)
         
         return image
     
+    # Các trường cần cho danh sách ảnh, không bao giờ tải dữ liệu ảnh
+    LISTING_FIELDS = ('id', 'description', 'created_at', 'uploaded_by')
+    
+    @staticmethod
+    def to_summary(doc):
+        """Chuyển document thô (as_pymongo) thành dict để trả về client"""
+        image_id = str(doc['_id'])
+        return {
+            'id': image_id,
+            'description': doc.get('description'),
+            'url': f"/api/images/file/{image_id}",
+            'created_at': doc['created_at'].isoformat() if doc.get('created_at') else None,
+            'uploaded_by': str(doc['uploaded_by']) if doc.get('uploaded_by') else None
+        }
+    
+    @staticmethod
+    def _list_summaries(queryset, page, per_page, cursor=None, count='none', filtered=True):
+        """Phân trang (page hoặc cursor) với projection, trả về dict thuần thay vì document đầy đủ"""
+        args = {'page': page, 'per_page': per_page, 'cursor': cursor, 'count': count}
+        result = paginate(queryset, args, fields=ImageService.LISTING_FIELDS, filtered=filtered)
+        result['items'] = [ImageService.to_summary(doc) for doc in result['items']]
+        return result
+    
     @staticmethod
-    def get_all_images(page=1, per_page=20):
-        """Lấy tất cả hình ảnh với phân trang"""
-        return Image.objects.order_by('-created_at').paginate(page=page, per_page=per_page)
+    def get_all_images(page=1, per_page=20, cursor=None, count='none'):
+        """Lấy tất cả hình ảnh với phân trang (cursor khác None: phân trang keyset)"""
+        return ImageService._list_summaries(Image.objects, page, per_page, cursor, count, filtered=False)
     
     @staticmethod
-    def get_user_images(user_id, page=1, per_page=20):
+    def get_user_images(user_id, page=1, per_page=20, cursor=None, count='none'):
         """Lấy tất cả hình ảnh được tải lên bởi một người dùng cụ thể"""
-        user = User.objects(id=user_id).first()
-        return Image.objects(uploaded_by=user).order_by('-created_at').paginate(page=page, per_page=per_page)
+        return ImageService._list_summaries(Image.objects(uploaded_by=user_id), page, per_page, cursor, count)
+    
+    @staticmethod
+    def search_images(query, page=1, per_page=20, user_id=None):
+        """
+        Tìm ảnh theo nội dung caption (description và caption_vi), không phân biệt hoa thường và dấu.
+        Mặc định dùng chỉ mục text của MongoDB, xếp theo textScore; với CAPTION_SEARCH_INDEX=memory
+        dùng chỉ mục ngược trong tiến trình (CaptionSearchIndex). user_id: chỉ tìm trong ảnh của người dùng đó.
+        Khác biệt duy nhất về khớp từ: chỉ mục trong bộ nhớ coi đ là d, $text của MongoDB thì không.
+        Trả về {'items': [dict], 'page', 'has_more'}.
+        """
+        search = text_query(query)
+        if not search:
+            raise ValueError("Từ khóa tìm kiếm không hợp lệ")
+        try:
+            owner = ObjectId(user_id) if user_id else None
+        except InvalidId:
+            raise ValueError("user_id không hợp lệ")
+        offset = (page - 1) * per_page
+        collection = Image._get_collection()
+        projection = {field: 1 for field in ('description', 'created_at', 'uploaded_by')}
+        
+        if CaptionSearchIndex.enabled():
+            ranked = CaptionSearchIndex.shared().search(query, offset, per_page + 1, owner)
+            docs = {doc['_id']: doc for doc in collection.find({'_id': {'$in': [i for i, _ in ranked]}}, projection)}
+            has_more = len(ranked) > per_page
+            # Ảnh đã bị xóa sau lần dựng chỉ mục gần nhất không còn trong docs
+            results = [dict(docs[image_id], score=score) for image_id, score in ranked[:per_page] if image_id in docs]
+        else:
+            criteria = {'$text': {'$search': search}}
+            if owner is not None:
+                criteria['uploaded_by'] = owner
+            projection['score'] = {'$meta': 'textScore'}
+            results = list(
+                collection.find(criteria, projection)
+                .sort([('score', {'$meta': 'textScore'}), ('created_at', -1)])
+                .skip(offset)
+                .limit(per_page + 1)
+            )
+            has_more = len(results) > per_page
+        
+        items = []
+        for doc in results[:per_page]:
+            summary = ImageService.to_summary(doc)
+            summary['score'] = doc.get('score')
+            items.append(summary)
+        return {'items': items, 'page': page, 'has_more': has_more}
     
     @staticmethod
     def get_image_by_id(image_id):
@@ -49,32 +161,112 @@ class ImageService:
         return Image.objects(id=image_id).first()
     
     @staticmethod
-    def get_image_data(image_id):
-        """Lấy dữ liệu nhị phân của hình ảnh để hiển thị"""
+    def read_image_data(image):
+        """Đọc dữ liệu nhị phân của ảnh từ kho blob"""
+        return get_blob_storage().read(image.content_hash)
+    
+    @staticmethod
+    def _release_blob(image):
+        """Xóa blob (thumbnail, audio) nếu không còn ảnh nào tham chiếu đến nội dung này"""
+        if image.content_hash and not Image.objects(content_hash=image.content_hash).first():
+            storage = get_blob_storage()
+            storage.delete(image.content_hash)
+            for variant_hash in ThumbnailService.variant_hashes(image):
+                storage.delete(variant_hash)
+        
+        # Audio có thể dùng chung giữa các ảnh có cùng caption
+        audio_hash = (image.audio or {}).get('content_hash')
+        if audio_hash and not Image.objects(__raw__={'audio.content_hash': audio_hash}).first():
+            get_blob_storage().delete(audio_hash)
+    
+    # Nội dung của một blob không bao giờ thay đổi nên có thể cache vĩnh viễn
+    IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+    # Cho URL có nội dung thay đổi theo thời gian (ví dụ audio của caption): luôn kiểm tra lại bằng ETag
+    REVALIDATE_CACHE_CONTROL = "no-cache"
+    
+    @staticmethod
+    def send_blob(content_hash, mimetype, size=None, last_modified=None, cache_control=IMMUTABLE_CACHE_CONTROL):
+        """
+        Trả về blob dưới dạng stream với các header cache:
+        - ETag mạnh là hash nội dung, Cache-Control (mặc định immutable), Last-Modified
+        - 304 khi If-None-Match khớp (không cần mở blob)
+        - Hỗ trợ HTTP Range (206) qua make_conditional
+        """
+        from flask import request, current_app, abort
+        from werkzeug.wsgi import wrap_file
+        
+        if request.if_none_match.contains(content_hash):
+            response = current_app.response_class(status=304)
+            response.set_etag(content_hash)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        
+        try:
+            blob = get_blob_storage().open(content_hash)
+        except KeyError:
+            return abort(404, description="Không có dữ liệu")
+        
+        if size is None:
+            blob.seek(0, 2)
+            size = blob.tell()
+            blob.seek(0)
+        
+        # Stream blob theo từng khối thay vì đọc toàn bộ vào bộ nhớ
+        response = current_app.response_class(
+            wrap_file(request.environ, blob),
+            mimetype=mimetype,
+            direct_passthrough=True
+        )
+        response.content_length = size
+        response.set_etag(content_hash)
+        response.headers['Cache-Control'] = cache_control
+        if last_modified:
+            response.last_modified = last_modified
+        
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
+    
+    @staticmethod
+    def get_image_data(image_id, width=None, fmt=None, accept=None):
+        """
+        Lấy dữ liệu nhị phân của hình ảnh để hiển thị.
+        Nếu có width: trả về thumbnail có độ rộng cấu hình gần nhất (WebP/JPEG).
+        """
+        from flask import abort
+        from bson.objectid import ObjectId
+        from bson.errors import InvalidId
+        from werkzeug.exceptions import HTTPException
+        
         try:
-            from bson.objectid import ObjectId
-            
             # Chuyển đổi image_id thành ObjectId
-            obj_id = ObjectId(image_id)
-            image = Image.objects(id=obj_id).first()
+            try:
+                obj_id = ObjectId(image_id)
+            except (InvalidId, TypeError):
+                return abort(404, description="Không tìm thấy ảnh")
+            
+            # Chỉ lấy metadata cần để phục vụ file
+            image = Image.objects(id=obj_id).only('content_hash', 'content_type', 'size', 'created_at', 'variants').first()
             
             if not image:
-                from flask import abort
                 return abort(404, description="Không tìm thấy ảnh")
             
-            if not hasattr(image, 'image_data') or not image.image_data:
-                from flask import abort
-                return abort(404, description="Không có dữ liệu ảnh")
+            if width:
+                variant = ThumbnailService.get_or_create_variant(
+                    image,
+                    ThumbnailService.pick_width(width),
+                    ThumbnailService.pick_format(fmt, accept)
+                )
+                response = ImageService.send_blob(
+                    variant['content_hash'], variant['content_type'], variant['size'], image.created_at
+                )
+                response.vary.add('Accept')
+                return response
             
             # Xác định MIME type
             mimetype = image.content_type if hasattr(image, 'content_type') and image.content_type else 'image/jpeg'
             
-            # Sử dụng các tham số cơ bản mà tất cả các phiên bản Flask đều hỗ trợ
-            return send_file(
-                io.BytesIO(image.image_data),
-                mimetype=mimetype,
-                as_attachment=False
-            )
+            return ImageService.send_blob(image.content_hash, mimetype, image.size, image.created_at)
+        except HTTPException:
+            raise
         except Exception as e:
             # Log lỗi
             import traceback
@@ -82,10 +274,8 @@ class ImageService:
             print(traceback.format_exc())
             
             # Trả về lỗi 500
-            from flask import abort
             return abort(500, description=f"Lỗi server: {str(e)}")
 
-    
     @staticmethod
     def update_image(image_id, user_id, description):
         """Cập nhật mô tả hình ảnh"""
@@ -117,8 +307,10 @@ class ImageService:
         if str(image.uploaded_by.id) != user_id and user.role != 'admin':
             return False
         
-        # Xóa bản ghi hình ảnh (dữ liệu nhị phân cũng sẽ bị xóa)
+        # Xóa bản ghi hình ảnh và blob nếu không còn được dùng
         image.delete()
+        StatsService.record_image_deleted()
+        ImageService._release_blob(image)
         
         return True
     
@@ -130,8 +322,10 @@ class ImageService:
         if not image:
             return False
         
-        # Xóa bản ghi hình ảnh
+        # Xóa bản ghi hình ảnh và blob nếu không còn được dùng
         image.delete()
+        StatsService.record_image_deleted()
+        ImageService._release_blob(image)
         
         return True
     
@@ -148,9 +342,11 @@ class ImageService:
         existing_report = Report.objects(image=image, reported_by=user).first()
         if existing_report:
             # Cập nhật lý do báo cáo nếu đã tồn tại
+            before_status = existing_report.status
             existing_report.reason = reason
             existing_report.status = 'pending'
             existing_report.save()
+            StatsService.record_report(before_status, 'pending')
             return True
         
         # Tạo báo cáo mới
@@ -160,17 +356,56 @@ class ImageService:
             reason=reason
         )
         report.save()
+        StatsService.record_report(None, report.status)
         
         return True
 
     @staticmethod
-    def get_reports(page=1, per_page=20, status=None):
-        """Lấy danh sách báo cáo (chỉ admin)"""
+    def get_reports(page=1, per_page=20, status=None, cursor=None, count='none'):
+        """
+        Lấy danh sách báo cáo (chỉ admin).
+        Ảnh và người báo cáo của cả trang được lấy bằng một truy vấn $in cho mỗi collection
+        (chỉ các trường cần hiển thị), thay vì dereference từng báo cáo.
+        """
         query = {}
         if status:
             query['status'] = status
         
-        return Report.objects(**query).order_by('-created_at').paginate(page=page, per_page=per_page)
+        args = {'page': page, 'per_page': per_page, 'cursor': cursor, 'count': count}
+        result = paginate(Report.objects(**query), args, filtered=bool(query))
+        reports = result['items']
+        
+        image_ids = list({report['image'] for report in reports if report.get('image')})
+        user_ids = list({report['reported_by'] for report in reports if report.get('reported_by')})
+        images = {
+            doc['_id']: doc for doc in Image.objects(id__in=image_ids).only('id', 'description').as_pymongo()
+        } if image_ids else {}
+        users = {
+            doc['_id']: doc for doc in User.objects(id__in=user_ids).only('id', 'username', 'full_name').as_pymongo()
+        } if user_ids else {}
+        
+        result['items'] = [ImageService.to_report_summary(report, images, users) for report in reports]
+        return result
+    
+    @staticmethod
+    def to_report_summary(report, images, users):
+        """Ghép báo cáo thô với ảnh/người báo cáo đã lấy sẵn thành dict trả về client"""
+        image_id = str(report['image']) if report.get('image') else None
+        image = images.get(report.get('image'), {})
+        reporter = users.get(report.get('reported_by'), {})
+        username = reporter.get('username', "Unknown")
+        return {
+            'id': str(report['_id']),
+            'image_id': image_id,
+            'image_url': f"/api/images/file/{image_id}" if image_id else None,
+            'image_description': image.get('description'),
+            'reported_by': str(report['reported_by']) if report.get('reported_by') else None,
+            'reporter_username': username,
+            'reporter_name': reporter.get('full_name') or username,
+            'reason': report.get('reason'),
+            'status': report.get('status'),
+            'created_at': report['created_at'].isoformat() if report.get('created_at') else None
+        }
 
     @staticmethod
     def update_report_status(report_id, status):
@@ -185,7 +420,9 @@ class ImageService:
         if not report:
             return False
         
+        before_status = report.status
         report.status = status
         report.save()
+        StatsService.record_report(before_status, status)
         
         return True
\ No newline at end of file
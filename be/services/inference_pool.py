@@ -0,0 +1,233 @@
+# services/inference_pool.py
+"""
+Pool tiến trình suy luận dùng chung cho nhiều web worker.
+
+Tiến trình server tải mô hình BLIP một lần, chuyển trọng số sang bộ nhớ dùng chung
+(model.share_memory()) rồi fork các worker: các worker dùng chung trang bộ nhớ trọng số
+(copy-on-write) thay vì mỗi web worker giữ một bản sao. Web worker gửi ảnh qua kênh IPC cục bộ
+(unix socket hoặc TCP localhost, multiprocessing.connection có xác thực authkey).
+
+Chạy server (từ thư mục be):
+    INFERENCE_SERVER_ADDRESS=/tmp/blip.sock INFERENCE_WORKERS=2 INFERENCE_TORCH_THREADS=2 \\
+        python -m services.inference_pool
+Sau đó đặt cùng INFERENCE_SERVER_ADDRESS cho web app để ImageCaptionService chuyển việc suy luận sang pool.
+"""
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import os
+import threading
+
+from services.caption_batcher import CaptionBatcher
+
+
+def parse_address(address):
+    """"host:port" -> (host, port), còn lại là đường dẫn unix socket"""
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address
+
+
+def _authkey():
+    return os.getenv("INFERENCE_AUTHKEY", "blip-inference").encode("utf-8")
+
+
+def _error_reply(error):
+    """
+    Thông điệp lỗi gửi qua kênh IPC: chỉ gửi chuỗi (tránh phụ thuộc vào việc pickle các kiểu exception),
+    đánh dấu "invalid" cho lỗi dữ liệu đầu vào (ValueError) để phía nhận ném lại ValueError (400 thay vì 500).
+    """
+    return ("invalid" if isinstance(error, ValueError) else "error", str(error))
+
+
+def _raise_reply(status, result):
+    if status == "invalid":
+        raise ValueError(result)
+    if status != "ok":
+        raise RuntimeError(result)
+    return result
+
+
+def _worker_main(conn, torch_threads):
+    """Vòng lặp của một worker: nhận batch (content_hash, bytes), trả về danh sách caption"""
+    import torch
+    from services.image_caption_service import ImageCaptionService
+
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    while True:
+        try:
+            payloads, params = conn.recv()
+        except EOFError:
+            return
+        try:
+            results = ImageCaptionService._caption_payloads(payloads, **params)
+            # Lỗi của từng ảnh chỉ giữ thông điệp và phân biệt lỗi đầu vào (ValueError) với lỗi khác
+            conn.send(("ok", [
+                (ValueError if isinstance(r, ValueError) else RuntimeError)(str(r)) if isinstance(r, Exception) else r
+                for r in results
+            ]))
+        except Exception as e:
+            conn.send(_error_reply(e))
+
+
+class _WorkerHandle:
+    """Một tiến trình worker cùng bộ gom batch riêng gửi batch tới nó"""
+
+    def __init__(self, context, index, torch_threads, max_batch_size, max_wait_ms):
+        self._context = context
+        self._index = index
+        self._torch_threads = torch_threads
+        self._lock = threading.Lock()
+        self._spawn()
+        self.batcher = CaptionBatcher(
+            self._run_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name=f"inference-batcher-{index}"
+        )
+
+    def _spawn(self):
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self._torch_threads),
+            name=f"inference-worker-{self._index}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+    def _run_batch(self, payloads, **params):
+        with self._lock:
+            try:
+                self._conn.send((payloads, params))
+                status, result = self._conn.recv()
+            except (EOFError, OSError, BrokenPipeError):
+                print(f"⚠️ Inference worker {self._index} đã dừng, khởi động lại")
+                self._spawn()
+                raise RuntimeError("Inference worker bị dừng khi đang xử lý")
+        return _raise_reply(status, result)
+
+
+class InferenceServer:
+    """Server IPC nhận yêu cầu caption và phân phối tới các worker ít tải nhất"""
+
+    def __init__(self, address, workers=2, torch_threads=1, max_batch_size=8, max_wait_ms=20):
+        from services.image_caption_service import ImageCaptionService
+
+        self.address = address
+
+        # Tải mô hình một lần trong tiến trình cha và đưa trọng số vào bộ nhớ dùng chung trước khi fork
+        _, model = ImageCaptionService._load_model_if_needed()
+        try:
+            model.share_memory()
+        except Exception as e:
+            # Một số mô-đun lượng tử hóa không hỗ trợ share_memory, vẫn dùng chung nhờ copy-on-write khi fork
+            print(f"⚠️ Không thể chuyển trọng số sang bộ nhớ dùng chung: {e}")
+
+        context = multiprocessing.get_context("fork")
+        self._workers = [
+            _WorkerHandle(context, i, torch_threads, max_batch_size, max_wait_ms)
+            for i in range(max(1, workers))
+        ]
+
+    def _pick_worker(self):
+        return min(self._workers, key=lambda worker: worker.batcher.queue_depth())
+
+    def _handle(self, conn):
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    return
+                command = message[0]
+                if command == "ping":
+                    conn.send(("ok", "pong"))
+                elif command == "metrics":
+                    conn.send(("ok", [worker.batcher.metrics.snapshot() for worker in self._workers]))
+                elif command == "caption":
+                    _, content_hash, image_data, params = message
+                    try:
+                        caption = self._pick_worker().batcher.submit((content_hash, image_data), **params).result()
+                        conn.send(("ok", caption))
+                    except Exception as e:
+                        conn.send(_error_reply(e))
+                else:
+                    conn.send(("error", f"Lệnh không hợp lệ: {command}"))
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        with Listener(self.address, authkey=_authkey()) as listener:
+            print(f"Inference server đang lắng nghe tại {self.address} với {len(self._workers)} worker")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi nhận kết nối: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+class InferenceClient:
+    """Client dùng trong web worker, mỗi luồng giữ một kết nối riêng tới inference server"""
+
+    def __init__(self, address):
+        self.address = parse_address(address)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _request(self, message):
+        # Thử lại một lần với kết nối mới nếu kết nối cũ đã bị đóng (server khởi động lại)
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send(message)
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                self._local.conn = None
+                if attempt == 1:
+                    raise
+        return _raise_reply(status, result)
+
+    def caption(self, image_data, content_hash, **params):
+        return self._request(("caption", content_hash, image_data, params))
+
+    def ping(self):
+        try:
+            return self._request(("ping",)) == "pong"
+        except Exception:
+            return False
+
+    def metrics(self):
+        return self._request(("metrics",))
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    server = InferenceServer(
+        parse_address(os.getenv("INFERENCE_SERVER_ADDRESS", "/tmp/blip-inference.sock")),
+        workers=int(os.getenv("INFERENCE_WORKERS", 2)),
+        torch_threads=int(os.getenv("INFERENCE_TORCH_THREADS", 1)),
+        max_batch_size=int(os.getenv("CAPTION_MAX_BATCH_SIZE", 8)),
+        max_wait_ms=float(os.getenv("CAPTION_BATCH_WAIT_MS", 20))
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
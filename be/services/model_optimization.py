@@ -0,0 +1,96 @@
+# services/model_optimization.py
+"""
+Các chế độ suy luận tối ưu cho BLIP trên CPU (chọn qua CAPTION_INFERENCE_MODE):
+- fp32:      mô hình PyTorch gốc.
+- int8:      lượng tử hóa động int8 các lớp Linear (torch.quantization.quantize_dynamic).
+- onnx:      vision encoder chạy bằng ONNX Runtime, text decoder vẫn là PyTorch fp32.
+- onnx-int8: vision encoder ONNX đã lượng tử hóa int8, text decoder PyTorch int8.
+Text decoder được giữ ở PyTorch vì beam search của generate() không xuất được thành một đồ thị ONNX đơn.
+"""
+import os
+import torch
+
+INFERENCE_MODES = ("fp32", "int8", "onnx", "onnx-int8")
+
+
+def quantize_dynamic_int8(module):
+    """Lượng tử hóa động int8 cho các lớp Linear (chỉ hỗ trợ CPU)"""
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _VisionEncoderWrapper(torch.nn.Module):
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+def export_vision_encoder_onnx(model, path, image_size, quantize=False):
+    """Xuất vision encoder của BLIP ra ONNX (batch động), tùy chọn lượng tử hóa int8 bằng ONNX Runtime"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fp32_path = path if not quantize else path.replace(".onnx", ".fp32.onnx")
+
+    if not os.path.exists(fp32_path):
+        dummy = torch.zeros(1, 3, image_size, image_size)
+        torch.onnx.export(
+            _VisionEncoderWrapper(model.vision_model).eval(),
+            (dummy,),
+            fp32_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=14
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+class OnnxVisionEncoder:
+    """Chạy vision encoder bằng ONNX Runtime, trả về image_embeds dạng torch.Tensor"""
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, pixel_values):
+        outputs = self._session.run(["image_embeds"], {"pixel_values": pixel_values.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def prepare_model(model, mode, model_path, image_size, device):
+    """
+    Áp dụng chế độ suy luận cho mô hình đã tải.
+    Trả về (model, vision_encoder): vision_encoder là OnnxVisionEncoder hoặc None (dùng model.vision_model).
+    """
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"CAPTION_INFERENCE_MODE không hợp lệ: {mode}. Các giá trị hợp lệ: {', '.join(INFERENCE_MODES)}")
+    if mode == "fp32":
+        return model, None
+    if device != "cpu":
+        print(f"⚠️ Chế độ {mode} chỉ hỗ trợ CPU, dùng fp32 trên {device}")
+        return model, None
+
+    vision_encoder = None
+    if mode.startswith("onnx"):
+        quantize = mode == "onnx-int8"
+        default_path = os.path.join(model_path, "onnx", "vision_encoder.int8.onnx" if quantize else "vision_encoder.onnx")
+        path = os.getenv("CAPTION_ONNX_PATH", default_path)
+        if not os.path.exists(path):
+            print(f"Đang xuất vision encoder ra ONNX tại {path}...")
+            export_vision_encoder_onnx(model, path, image_size, quantize=quantize)
+        threads = int(os.getenv("CAPTION_ONNX_THREADS", 0)) or None
+        vision_encoder = OnnxVisionEncoder(path, num_threads=threads)
+
+    if mode in ("int8", "onnx-int8"):
+        model = quantize_dynamic_int8(model)
+
+    return model, vision_encoder
@@ -0,0 +1,126 @@
+# services/pagination.py
+"""
+Phân trang cho các API danh sách.
+- Kiểu page/per_page (mặc định, giữ tương thích): skip() + count(), chậm dần khi đi sâu vào collection.
+- Kiểu cursor (keyset): gửi tham số cursor (rỗng cho trang đầu), nhận next_cursor cho trang sau.
+  Mỗi trang chỉ là một truy vấn theo chỉ mục (created_at, _id) bắt đầu ngay sau phần tử cuối của trang trước,
+  tốn như nhau dù ở trang nào. Tổng số phần tử chỉ được đếm khi yêu cầu (count=exact|estimated).
+"""
+import base64
+import datetime
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+COUNT_MODES = ("none", "exact", "estimated")
+
+
+def encode_cursor(created_at, object_id):
+    """Cursor mờ (opaque) mã hóa vị trí (created_at, _id) của phần tử cuối cùng trong trang"""
+    payload = json.dumps({"t": created_at.isoformat() if created_at else None, "id": str(object_id)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        created_at = datetime.datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return created_at, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Cursor không hợp lệ")
+
+
+def _after(created_at, object_id):
+    """Điều kiện "đứng sau" vị trí cursor theo thứ tự (created_at giảm dần, _id giảm dần)"""
+    if created_at is None:
+        # Phần tử không có created_at được xếp cuối (null nhỏ nhất khi sắp xếp giảm dần)
+        return {'created_at': None, '_id': {'$lt': object_id}}
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': object_id}},
+        {'created_at': None}
+    ]}
+
+
+def count_queryset(queryset, mode, filtered=True):
+    """Đếm theo chế độ: exact (count), estimated (metadata của collection, chỉ khi không lọc), none"""
+    if mode == "exact" or (mode == "estimated" and filtered):
+        return queryset.count()
+    if mode == "estimated":
+        return queryset._document._get_collection().estimated_document_count()
+    return None
+
+
+def keyset_page(queryset, cursor=None, per_page=20, fields=None, raw=True, count="none", filtered=True):
+    """
+    Lấy một trang theo cursor. queryset chưa được sắp xếp; thứ tự luôn là (-created_at, -_id).
+    Trả về {'items', 'next_cursor', 'has_more', 'total'}.
+    """
+    if count not in COUNT_MODES:
+        raise ValueError(f"Tham số count không hợp lệ. Các giá trị hợp lệ: {', '.join(COUNT_MODES)}")
+
+    total = count_queryset(queryset, count, filtered)
+    page_query = queryset
+    if cursor:
+        page_query = page_query.filter(__raw__=_after(*decode_cursor(cursor)))
+    page_query = page_query.order_by('-created_at', '-id')
+    if fields:
+        page_query = page_query.only(*fields)
+    if raw:
+        page_query = page_query.no_dereference().as_pymongo()
+
+    docs = list(page_query.limit(per_page + 1))
+    has_more = len(docs) > per_page
+    docs = docs[:per_page]
+
+    next_cursor = None
+    if has_more:
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get('created_at'), last['_id']) if raw else encode_cursor(last.created_at, last.id)
+
+    return {'items': docs, 'next_cursor': next_cursor, 'has_more': has_more, 'total': total}
+
+
+def offset_page(queryset, page=1, per_page=20, fields=None, raw=True):
+    """Phân trang kiểu page/per_page, trả về {'items', 'total', 'pages', 'page'}"""
+    total = queryset.count()
+    page_query = queryset.order_by('-created_at', '-id')
+    if fields:
+        page_query = page_query.only(*fields)
+    if raw:
+        page_query = page_query.no_dereference().as_pymongo()
+    return {
+        'items': list(page_query.skip((page - 1) * per_page).limit(per_page)),
+        'total': total,
+        'pages': (total + per_page - 1) // per_page if per_page else 0,
+        'page': page
+    }
+
+
+def paginate(queryset, args, fields=None, raw=True, filtered=True):
+    """Chọn kiểu phân trang theo args (xem page_args)"""
+    if args['cursor'] is not None:
+        return keyset_page(queryset, args['cursor'], args['per_page'], fields, raw, args['count'], filtered)
+    return offset_page(queryset, args['page'], args['per_page'], fields, raw)
+
+
+def page_args(args, max_per_page=100):
+    """Đọc page, per_page, cursor, count từ query string"""
+    try:
+        page = max(int(args.get('page', 1)), 1)
+        per_page = min(max(int(args.get('per_page', 20)), 1), max_per_page)
+    except (TypeError, ValueError):
+        raise ValueError("Tham số phân trang không hợp lệ")
+    return {
+        'page': page,
+        'per_page': per_page,
+        'cursor': args.get('cursor'),
+        'count': args.get('count', 'none')
+    }
+
+
+def page_meta(result):
+    """Các trường phân trang (không gồm items) để trả về client"""
+    return {key: value for key, value in result.items() if key != 'items'}
@@ -0,0 +1,137 @@
+# services/speech_backends.py
+import io
+import os
+import subprocess
+import threading
+import wave
+
+class TranslationBackend:
+    """Giao diện dịch văn bản"""
+    name = "base"
+
+    def translate(self, text, src, dest):
+        raise NotImplementedError
+
+
+class GoogleTranslationBackend(TranslationBackend):
+    """Dịch qua Google Translate (googletrans), cần kết nối mạng"""
+    name = "google"
+
+    def __init__(self):
+        from googletrans import Translator
+        self._translator = Translator()  # Tái sử dụng translator
+
+    def translate(self, text, src, dest):
+        return self._translator.translate(text, src=src, dest=dest).text
+
+
+class ArgosTranslationBackend(TranslationBackend):
+    """Dịch offline bằng Argos Translate (cần cài gói ngôn ngữ en->vi trước)"""
+    name = "argos"
+
+    def __init__(self):
+        try:
+            import argostranslate.translate
+        except ImportError:
+            raise RuntimeError("Chưa cài argostranslate, không thể dùng TRANSLATION_BACKEND=argos")
+        self._translate = argostranslate.translate.translate
+
+    def translate(self, text, src, dest):
+        return self._translate(text, src, dest)
+
+
+class StubTranslationBackend(TranslationBackend):
+    """Backend giả lập cho kiểm thử: kết quả xác định, không gọi mạng"""
+    name = "stub"
+
+    def translate(self, text, src, dest):
+        return f"[{dest}] {text}"
+
+
+class TTSBackend:
+    """Giao diện tổng hợp giọng nói, trả về (dữ liệu audio, MIME type)"""
+    name = "base"
+
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Tổng hợp giọng nói qua gTTS, cần kết nối mạng"""
+    name = "gtts"
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+
+        output = io.BytesIO()
+        gTTS(text, lang=lang).write_to_fp(output)
+        return output.getvalue(), "audio/mpeg"
+
+
+class EspeakTTSBackend(TTSBackend):
+    """Tổng hợp giọng nói offline bằng espeak-ng (hỗ trợ tiếng Việt), trả về WAV"""
+    name = "espeak"
+
+    def __init__(self):
+        self._binary = os.getenv("ESPEAK_BINARY", "espeak-ng")
+
+    def synthesize(self, text, lang):
+        result = subprocess.run(
+            [self._binary, "-v", lang, "--stdout", text],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+            check=True
+        )
+        return result.stdout, "audio/wav"
+
+
+class StubTTSBackend(TTSBackend):
+    """Backend giả lập cho kiểm thử: WAV im lặng, độ dài phụ thuộc độ dài văn bản"""
+    name = "stub"
+
+    def synthesize(self, text, lang):
+        sample_rate = 8000
+        frames = sample_rate * max(1, len(text)) // 20
+        output = io.BytesIO()
+        with wave.open(output, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(1)
+            wav.setframerate(sample_rate)
+            wav.writeframes(b"\x80" * frames)
+        return output.getvalue(), "audio/wav"
+
+
+TRANSLATION_BACKENDS = {
+    "google": GoogleTranslationBackend,
+    "argos": ArgosTranslationBackend,
+    "stub": StubTranslationBackend
+}
+
+TTS_BACKENDS = {
+    "gtts": GTTSBackend,
+    "espeak": EspeakTTSBackend,
+    "stub": StubTTSBackend
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def _get_backend(registry, env_name, default):
+    name = os.getenv(env_name, default).lower()
+    if name not in registry:
+        raise ValueError(f"{env_name} không hợp lệ: {name}. Các giá trị hợp lệ: {', '.join(registry)}")
+    key = (env_name, name)
+    if key not in _backends:
+        with _backends_lock:
+            if key not in _backends:
+                _backends[key] = registry[name]()
+    return _backends[key]
+
+def get_translation_backend():
+    """Backend dịch theo cấu hình TRANSLATION_BACKEND (google, argos, stub)"""
+    return _get_backend(TRANSLATION_BACKENDS, "TRANSLATION_BACKEND", "google")
+
+def get_tts_backend():
+    """Backend giọng nói theo cấu hình TTS_BACKEND (gtts, espeak, stub)"""
+    return _get_backend(TTS_BACKENDS, "TTS_BACKEND", "gtts")
@@ -0,0 +1,132 @@
+# services/speech_service.py
+from models.image import Image
+from services.blob_storage import get_blob_storage
+from services.speech_backends import get_translation_backend, get_tts_backend
+from services.caption_cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+
+class SpeechService:
+    """
+    Bước chuyển caption thành giọng nói, chạy bất đồng bộ ngoài luồng request:
+    - Dịch caption tiếng Anh sang tiếng Việt.
+    - Tổng hợp giọng nói (mp3) và lưu vào kho blob.
+    - Ghi caption_vi và thông tin audio vào document Image để client tải qua API.
+    Backend dịch/giọng nói được chọn qua cấu hình (xem speech_backends), kết quả được cache
+    theo (văn bản, ngôn ngữ) nên các caption lặp lại chỉ được dịch và tổng hợp một lần.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=int(os.getenv("TTS_WORKERS", 2)), thread_name_prefix="tts")
+    _translation_cache = LRUCache(int(os.getenv("TRANSLATION_CACHE_SIZE", 4096)))
+    _audio_cache = LRUCache(int(os.getenv("TTS_CACHE_SIZE", 1024)))
+    # Job đang chờ quá lâu (tiến trình chết, task bị mất) được coi là hỏng và tạo lại
+    _pending_timeout = float(os.getenv("TTS_PENDING_TIMEOUT_SECONDS", 120))
+    # Thử lại sau khi lỗi: chờ TTS_RETRY_BACKOFF_SECONDS * 2^(số lần lỗi - 1), tối đa TTS_RETRY_MAX_BACKOFF_SECONDS
+    _retry_backoff = float(os.getenv("TTS_RETRY_BACKOFF_SECONDS", 30))
+    _retry_max_backoff = float(os.getenv("TTS_RETRY_MAX_BACKOFF_SECONDS", 3600))
+
+    @classmethod
+    def translate(cls, text, src='en', dest='vi'):
+        """Dịch văn bản (mặc định tiếng Anh sang tiếng Việt)"""
+        backend = get_translation_backend()
+        key = (backend.name, src, dest, text)
+        translated = cls._translation_cache.get(key)
+        if translated is None:
+            translated = backend.translate(text, src, dest)
+            cls._translation_cache.put(key, translated)
+        return translated
+
+    @classmethod
+    def synthesize(cls, text, lang='vi'):
+        """
+        Tổng hợp giọng nói và lưu vào kho blob.
+        Trả về dict {content_hash, size, content_type}.
+        """
+        backend = get_tts_backend()
+        key = (backend.name, lang, text)
+        stored = cls._audio_cache.get(key)
+        if stored is not None and get_blob_storage().exists(stored['content_hash']):
+            return dict(stored)
+
+        data, content_type = backend.synthesize(text, lang)
+        content_hash, size = get_blob_storage().put(data)
+        stored = {'content_hash': content_hash, 'size': size, 'content_type': content_type}
+        cls._audio_cache.put(key, stored)
+        return dict(stored)
+
+    @staticmethod
+    def is_audio_current(image):
+        """Audio đã có và được tạo từ đúng caption hiện tại"""
+        audio = image.audio or {}
+        return bool(audio.get('content_hash')) and audio.get('source_caption') == image.description
+
+    @classmethod
+    def generate_audio_for_image(cls, image_id):
+        """Dịch và tổng hợp giọng nói cho caption hiện tại của ảnh"""
+        image = Image.objects(id=image_id).only('description', 'audio').first()
+        if not image or not image.description:
+            return None
+        if cls.is_audio_current(image):
+            if image.audio.get('status') != 'ready':
+                Image.objects(id=image_id).update_one(set__audio__status='ready')
+            return image.audio
+
+        caption_en = image.description
+        try:
+            caption_vi = cls.translate(caption_en)
+            print("🔁 Dịch sang tiếng Việt:", caption_vi)
+
+            audio = cls.synthesize(caption_vi)
+            audio.update({'status': 'ready', 'source_caption': caption_en, 'requested_caption': caption_en})
+            Image.objects(id=image_id).update_one(set__caption_vi=caption_vi, set__audio=audio)
+            return audio
+        except Exception as e:
+            print(f"⚠️ Lỗi khi tạo audio cho caption: {e}")
+            previous = image.audio or {}
+            attempts = previous.get('attempts', 0) if previous.get('requested_caption') == caption_en else 0
+            Image.objects(id=image_id).update_one(set__audio={
+                'status': 'failed',
+                'source_caption': caption_en,
+                'requested_caption': caption_en,
+                'error': str(e),
+                'failed_at': datetime.datetime.now(),
+                'attempts': attempts + 1
+            })
+            return None
+
+    @classmethod
+    def needs_schedule(cls, image):
+        """
+        Có cần (tạo lại) job audio cho caption hiện tại không (audio chưa khớp caption):
+        - pending: chỉ khi job dành cho caption khác hoặc đã chờ quá TTS_PENDING_TIMEOUT_SECONDS
+        - failed: khi caption đã đổi, hoặc đã hết thời gian chờ thử lại (tăng dần theo số lần lỗi)
+        """
+        audio = image.audio or {}
+        now = datetime.datetime.now()
+        if audio.get('requested_caption') != image.description:
+            return True
+        if audio.get('status') == 'pending':
+            requested_at = audio.get('requested_at')
+            return not requested_at or (now - requested_at).total_seconds() > cls._pending_timeout
+        if audio.get('status') == 'failed':
+            failed_at = audio.get('failed_at')
+            backoff = min(cls._retry_backoff * 2 ** (audio.get('attempts', 1) - 1), cls._retry_max_backoff)
+            return not failed_at or (now - failed_at).total_seconds() > backoff
+        return True
+
+    @classmethod
+    def schedule_for_image(cls, image_id, caption=None):
+        """
+        Đưa việc tạo audio vào thread nền, request không phải chờ.
+        Ghi lại caption và thời điểm yêu cầu để phát hiện job bị mất hoặc đã cũ (xem needs_schedule).
+        """
+        if caption is None:
+            image = Image.objects(id=image_id).only('description').first()
+            caption = image.description if image else None
+        Image.objects(id=image_id).update_one(
+            set__audio__status='pending',
+            set__audio__requested_caption=caption,
+            set__audio__requested_at=datetime.datetime.now()
+        )
+        return cls._executor.submit(cls.generate_audio_for_image, image_id)
@@ -0,0 +1,272 @@
+# services/stats_service.py
+from pymongo.errors import OperationFailure
+import datetime
+import threading
+import time
+import os
+
+REPORT_STATUSES = ("pending", "reviewed", "rejected", "approved")
+
+
+class StatsService:
+    """
+    Thống kê cho dashboard admin.
+    - compute(): tính tất cả số đếm bằng một aggregation $facet duy nhất (users + images + reports qua $unionWith).
+    - Khi bật STATS_MATERIALIZED: các số đếm được lưu trong collection stats và cập nhật tăng dần ($inc)
+      mỗi khi người dùng/ảnh/báo cáo được tạo, sửa, xóa; đọc dashboard chỉ cần một find_one.
+      Một luồng nền đối soát lại với compute() mỗi STATS_RECONCILE_SECONDS giây.
+    - Chuỗi theo ngày: số ảnh tải lên (tính bằng aggregation, hoặc lưu sẵn khi bật STATS_MATERIALIZED) và
+      số caption được tạo (luôn được đếm tăng dần trong các document daily:<YYYY-MM-DD>, ở cả hai chế độ).
+    """
+
+    _materialized = os.getenv("STATS_MATERIALIZED", "false").lower() == "true"
+    _reconcile_interval = float(os.getenv("STATS_RECONCILE_SECONDS", 3600))
+    _series_days = int(os.getenv("STATS_SERIES_DAYS", 30))
+    _reconciler = None
+    _reconciler_lock = threading.Lock()
+
+    TOTALS_ID = "totals"
+
+    @staticmethod
+    def _collection():
+        from mongoengine.connection import get_db
+        return get_db().stats
+
+    @staticmethod
+    def _day_id(day):
+        return f"daily:{day.strftime('%Y-%m-%d')}"
+
+    # ---- Tính toàn bộ bằng aggregation ----
+
+    @staticmethod
+    def _users_facet():
+        return [{'$group': {
+            '_id': None,
+            'total': {'$sum': 1},
+            'active': {'$sum': {'$cond': [{'$eq': ['$is_active', True]}, 1, 0]}},
+            'admins': {'$sum': {'$cond': [{'$eq': ['$role', 'admin']}, 1, 0]}}
+        }}]
+
+    @staticmethod
+    def _images_facet():
+        return [{'$count': 'total'}]
+
+    @staticmethod
+    def _reports_facet():
+        return [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]
+
+    @staticmethod
+    def _uploads_facet(since):
+        return [
+            {'$match': {'created_at': {'$gte': since}}},
+            {'$group': {'_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}}, 'count': {'$sum': 1}}}
+        ]
+
+    @classmethod
+    def _facet_pipeline(cls, since):
+        """Gộp ba collection thành một luồng (chỉ giữ các trường cần đếm) rồi đếm trong một $facet"""
+        kind = lambda name: {'$match': {'kind': name}}
+        return [
+            {'$project': {'_id': 0, 'kind': {'$literal': 'user'}, 'is_active': 1, 'role': 1}},
+            {'$unionWith': {'coll': 'images', 'pipeline': [
+                {'$project': {'_id': 0, 'kind': {'$literal': 'image'}, 'created_at': 1}}
+            ]}},
+            {'$unionWith': {'coll': 'reports', 'pipeline': [
+                {'$project': {'_id': 0, 'kind': {'$literal': 'report'}, 'status': 1}}
+            ]}},
+            {'$facet': {
+                'users': [kind('user')] + cls._users_facet(),
+                'images': [kind('image')] + cls._images_facet(),
+                'reports': [kind('report')] + cls._reports_facet(),
+                'uploads_per_day': [kind('image')] + cls._uploads_facet(since)
+            }}
+        ]
+
+    @classmethod
+    def compute(cls):
+        """Tính số đếm trực tiếp từ các collection (cần MongoDB 4.4+ cho $unionWith)"""
+        from models.user import User
+
+        since = datetime.datetime.combine(
+            datetime.date.today() - datetime.timedelta(days=cls._series_days - 1), datetime.time.min
+        )
+        try:
+            result = next(User._get_collection().aggregate(cls._facet_pipeline(since)))
+        except OperationFailure:
+            # MongoDB cũ không có $unionWith: một $facet cho mỗi collection
+            result = cls._compute_per_collection(since)
+
+        users = result['users'][0] if result['users'] else {'total': 0, 'active': 0, 'admins': 0}
+        reports = {status: 0 for status in REPORT_STATUSES}
+        for row in result['reports']:
+            if row['_id'] in reports:
+                reports[row['_id']] = row['count']
+
+        return {
+            'users': users['total'],
+            'users_active': users['active'],
+            'users_inactive': users['total'] - users['active'],
+            'users_admin': users['admins'],
+            'images': result['images'][0]['total'] if result['images'] else 0,
+            'reports': sum(reports.values()),
+            'reports_by_status': reports,
+            'uploads_per_day': {row['_id']: row['count'] for row in result['uploads_per_day']}
+        }
+
+    @classmethod
+    def _compute_per_collection(cls, since):
+        from models.user import User
+        from models.image import Image
+        from models.report import Report
+
+        result = next(User._get_collection().aggregate([{'$facet': {'users': cls._users_facet()}}]))
+        result.update(next(Image._get_collection().aggregate([{'$facet': {
+            'images': cls._images_facet(),
+            'uploads_per_day': cls._uploads_facet(since)
+        }}])))
+        result.update(next(Report._get_collection().aggregate([{'$facet': {'reports': cls._reports_facet()}}])))
+        return result
+
+    # ---- Bộ đếm lưu sẵn ----
+
+    @classmethod
+    def _inc(cls, doc_id, fields, always=False):
+        """always: ghi cả khi không bật STATS_MATERIALIZED (số liệu không tính lại được từ dữ liệu, ví dụ caption)"""
+        fields = {key: value for key, value in fields.items() if value}
+        if not (cls._materialized or always) or not fields:
+            return
+        try:
+            cls._collection().update_one({'_id': doc_id}, {'$inc': fields}, upsert=True)
+        except Exception as e:
+            # Thống kê không được làm hỏng thao tác chính, lần đối soát tiếp theo sẽ sửa lại
+            print(f"⚠️ Lỗi khi cập nhật thống kê: {e}")
+
+    @staticmethod
+    def _user_fields(state, sign):
+        if not state:
+            return {}
+        return {
+            'users': sign,
+            'users_active': sign if state['is_active'] else 0,
+            'users_inactive': 0 if state['is_active'] else sign,
+            'users_admin': sign if state['role'] == 'admin' else 0
+        }
+
+    @staticmethod
+    def user_state(user):
+        return {'is_active': bool(user.is_active), 'role': user.role} if user else None
+
+    @classmethod
+    def record_user(cls, before, after):
+        """before/after: user_state() trước và sau thay đổi (None khi tạo mới/xóa)"""
+        fields = cls._user_fields(before, -1)
+        for key, value in cls._user_fields(after, 1).items():
+            fields[key] = fields.get(key, 0) + value
+        cls._inc(cls.TOTALS_ID, fields)
+
+    @classmethod
+    def record_image_uploaded(cls):
+        cls._inc(cls.TOTALS_ID, {'images': 1})
+        cls._inc(cls._day_id(datetime.date.today()), {'uploads': 1})
+
+    @classmethod
+    def record_image_deleted(cls):
+        cls._inc(cls.TOTALS_ID, {'images': -1})
+
+    @classmethod
+    def record_report(cls, before_status, after_status):
+        fields = {}
+        if before_status:
+            fields['reports'] = -1
+            fields[f'reports_by_status.{before_status}'] = -1
+        if after_status:
+            fields['reports'] = fields.get('reports', 0) + 1
+            key = f'reports_by_status.{after_status}'
+            fields[key] = fields.get(key, 0) + 1
+        cls._inc(cls.TOTALS_ID, fields)
+
+    @classmethod
+    def record_captions(cls, count=1):
+        """Số caption được mô hình tạo ra (không tính caption lấy từ CaptionCache)"""
+        # Caption không để lại dấu vết nào để đếm lại, nên luôn được ghi vào document daily
+        cls._inc(cls._day_id(datetime.date.today()), {'captions': count}, always=True)
+
+    # ---- Đọc và đối soát ----
+
+    @classmethod
+    def reconcile(cls):
+        """Ghi đè bộ đếm tổng và số ảnh tải lên theo ngày bằng kết quả tính lại từ dữ liệu"""
+        stats = cls.compute()
+        uploads_per_day = stats.pop('uploads_per_day')
+        collection = cls._collection()
+        stats['reconciled_at'] = datetime.datetime.now()
+        collection.replace_one({'_id': cls.TOTALS_ID}, stats, upsert=True)
+        for day, count in uploads_per_day.items():
+            collection.update_one({'_id': f"daily:{day}"}, {'$set': {'uploads': count}}, upsert=True)
+        return stats
+
+    @staticmethod
+    def _with_defaults(stats):
+        """Bổ sung các số đếm còn thiếu bằng 0 để dashboard luôn có đủ trường"""
+        for key in ('users', 'users_active', 'users_inactive', 'users_admin', 'images', 'reports'):
+            stats.setdefault(key, 0)
+        stats['reports_by_status'] = {
+            status: (stats.get('reports_by_status') or {}).get(status, 0) for status in REPORT_STATUSES
+        }
+        return stats
+
+    @classmethod
+    def _series(cls, uploads_per_day=None):
+        """
+        Chuỗi theo ngày từ các document daily. uploads_per_day (từ compute()) thay cho số ảnh tải lên
+        lưu sẵn khi không bật STATS_MATERIALIZED; số caption luôn lấy từ document daily.
+        """
+        today = datetime.date.today()
+        days = [today - datetime.timedelta(days=i) for i in range(cls._series_days - 1, -1, -1)]
+        docs = {doc['_id']: doc for doc in cls._collection().find({'_id': {'$in': [cls._day_id(d) for d in days]}})}
+        return [
+            {
+                'date': day.isoformat(),
+                'uploads': uploads_per_day.get(day.isoformat(), 0) if uploads_per_day is not None
+                else docs.get(cls._day_id(day), {}).get('uploads', 0),
+                'captions': docs.get(cls._day_id(day), {}).get('captions', 0)
+            }
+            for day in days
+        ]
+
+    @classmethod
+    def get_stats(cls):
+        """Thống kê cho dashboard: từ bộ đếm lưu sẵn nếu bật, ngược lại tính bằng aggregation"""
+        if not cls._materialized:
+            stats = cls.compute()
+            stats['daily'] = cls._series(stats.pop('uploads_per_day'))
+            return stats
+
+        cls.start_reconciler()
+        stats = cls._collection().find_one({'_id': cls.TOTALS_ID})
+        if not stats or 'reconciled_at' not in stats:
+            # Chưa từng đối soát: document có thể chỉ gồm vài trường do $inc (upsert) tạo ra
+            stats = cls.reconcile()
+        stats.pop('_id', None)
+        stats = cls._with_defaults(stats)
+        stats['daily'] = cls._series()
+        return stats
+
+    @classmethod
+    def _reconcile_loop(cls):
+        while True:
+            try:
+                cls.reconcile()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi đối soát thống kê: {e}")
+            time.sleep(cls._reconcile_interval)
+
+    @classmethod
+    def start_reconciler(cls):
+        """Khởi động luồng đối soát định kỳ (một lần cho mỗi tiến trình)"""
+        if not cls._materialized or cls._reconciler is not None:
+            return
+        with cls._reconciler_lock:
+            if cls._reconciler is None:
+                cls._reconciler = threading.Thread(target=cls._reconcile_loop, name="stats-reconciler", daemon=True)
+                cls._reconciler.start()
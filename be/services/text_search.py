@@ -0,0 +1,74 @@
+# services/text_search.py
+"""
+Chuẩn hóa văn bản cho tìm kiếm: chữ thường, bỏ dấu tiếng Việt (đ -> d), tách token theo chữ/số.
+Dùng chung cho khóa tìm kiếm người dùng và tìm kiếm caption.
+"""
+import re
+import unicodedata
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Số token tối đa của một truy vấn, tránh truy vấn quá dài làm nặng database
+MAX_QUERY_TOKENS = 8
+
+
+def normalize(text):
+    """"Ảnh Đẹp" -> "anh dep" """
+    if not text:
+        return ""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(normalize(text))
+
+
+def query_tokens(query):
+    """Token của truy vấn người dùng (đã chuẩn hóa, bỏ trùng, giữ thứ tự, tối đa MAX_QUERY_TOKENS)"""
+    tokens = []
+    for token in tokenize(query):
+        if token not in tokens:
+            tokens.append(token)
+    return tokens[:MAX_QUERY_TOKENS]
+
+
+def username_key(username):
+    """Username đã chuẩn hóa, trùng với khóa đầu tiên của build_user_search_keys"""
+    return normalize(username).strip()
+
+
+def text_query(query):
+    """
+    Chuỗi $search cho chỉ mục text của MongoDB: chỉ giữ các từ (bỏ cú pháp cụm từ "..." và phủ định -),
+    chữ thường, giữ nguyên dấu vì chỉ mục text đã không phân biệt dấu.
+    """
+    words = []
+    for word in _TOKEN_PATTERN.findall((query or "").lower()):
+        if word not in words:
+            words.append(word)
+    return " ".join(words[:MAX_QUERY_TOKENS])
+
+
+def prefix_pattern(token):
+    """Regex neo đầu chuỗi đã escape đầu vào: MongoDB dùng được chỉ mục, không có mẫu gây backtracking"""
+    return "^" + re.escape(token)
+
+
+def build_user_search_keys(username, email, full_name):
+    """
+    Khóa tìm kiếm của người dùng (lưu trong User.search_keys, có chỉ mục multikey):
+    username, email, phần trước @ của email, họ tên đầy đủ, từng từ trong username và họ tên, đều đã chuẩn hóa.
+    Tìm theo tiền tố trên các khóa này tương đương tìm "bắt đầu bằng" trên từng trường.
+    Khóa đầu tiên luôn là username đã chuẩn hóa (dùng khi xếp hạng kết quả).
+    """
+    keys = []
+    for value in (username_key(username), email, (email or "").split("@")[0], full_name):
+        value = normalize(value).strip()
+        if value and value not in keys:
+            keys.append(value)
+    for token in tokenize(username) + tokenize(full_name):
+        if token not in keys:
+            keys.append(token)
+    return keys
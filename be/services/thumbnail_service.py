@@ -0,0 +1,123 @@
+# services/thumbnail_service.py
+from models.image import Image
+from services.blob_storage import get_blob_storage
+from services.image_preprocessing import ImagePreprocessor
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage
+import io
+import os
+
+class ThumbnailService:
+    """
+    Tạo các phiên bản thu nhỏ (thumbnail) của ảnh ở một số độ rộng cấu hình sẵn.
+    - Khi upload: sinh toàn bộ biến thể trong thread nền.
+    - Ảnh cũ chưa có biến thể: sinh lười (lazy) ở lần truy cập đầu tiên.
+    Các biến thể được lưu trong kho blob, Image.variants ánh xạ "w<width>_<format>" tới blob.
+    """
+
+    FORMATS = {
+        "webp": ("WEBP", "image/webp"),
+        "jpeg": ("JPEG", "image/jpeg")
+    }
+
+    DEFAULT_WIDTHS = (160, 320, 640)
+
+    # THUMBNAIL_WIDTHS rỗng (hoặc chỉ có khoảng trắng) thì dùng độ rộng mặc định
+    _widths = sorted(int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "").split(",") if w.strip()) or list(DEFAULT_WIDTHS)
+    _quality = int(os.getenv("THUMBNAIL_QUALITY", 80))
+    _executor = ThreadPoolExecutor(max_workers=int(os.getenv("THUMBNAIL_WORKERS", 2)), thread_name_prefix="thumbnail")
+
+    @staticmethod
+    def variant_key(width, fmt):
+        return f"w{width}_{fmt}"
+
+    @classmethod
+    def pick_width(cls, requested):
+        """Chọn độ rộng cấu hình nhỏ nhất >= độ rộng yêu cầu (tránh sinh ảnh với kích thước tùy ý)"""
+        for width in cls._widths:
+            if width >= requested:
+                return width
+        return cls._widths[-1]
+
+    @classmethod
+    def pick_format(cls, requested=None, accept=None):
+        """Ưu tiên định dạng được yêu cầu, sau đó WebP nếu trình duyệt hỗ trợ, cuối cùng là JPEG"""
+        if requested in cls.FORMATS:
+            return requested
+        if accept and "image/webp" in accept:
+            return "webp"
+        return "jpeg"
+
+    @classmethod
+    def _decode(cls, data, max_width):
+        # Kiểm tra giới hạn decompression bomb trước khi giải mã
+        image = ImagePreprocessor.open(data)
+        # Với JPEG, draft() cho phép giải mã trực tiếp ở độ phân giải thấp hơn
+        if image.format == "JPEG":
+            image.draft("RGB", (max_width, max_width * image.height // max(image.width, 1)))
+        image.load()
+        return image
+
+    @classmethod
+    def _encode(cls, image, fmt):
+        pil_format, _ = cls.FORMATS[fmt]
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        output = io.BytesIO()
+        image.save(output, format=pil_format, quality=cls._quality)
+        return output.getvalue()
+
+    @classmethod
+    def _render(cls, data, widths, formats):
+        """Giải mã ảnh một lần, thu nhỏ dần từ lớn đến nhỏ, trả về {key: (bytes, content_type)}"""
+        image = cls._decode(data, max(widths))
+        results = {}
+        for width in sorted(widths, reverse=True):
+            if image.width > width:
+                image.thumbnail((width, image.height * width // image.width), PILImage.LANCZOS)
+            for fmt in formats:
+                results[cls.variant_key(width, fmt)] = (cls._encode(image, fmt), cls.FORMATS[fmt][1])
+        return results
+
+    @classmethod
+    def _store(cls, image_id, rendered):
+        storage = get_blob_storage()
+        variants = {}
+        updates = {}
+        for key, (data, content_type) in rendered.items():
+            content_hash, size = storage.put(data)
+            variants[key] = {"content_hash": content_hash, "size": size, "content_type": content_type}
+            updates[f"set__variants__{key}"] = variants[key]
+        Image.objects(id=image_id).update_one(**updates)
+        return variants
+
+    @classmethod
+    def generate_variants(cls, image_id, content_hash):
+        """Sinh toàn bộ biến thể cho một ảnh"""
+        try:
+            data = get_blob_storage().read(content_hash)
+            cls._store(image_id, cls._render(data, cls._widths, list(cls.FORMATS)))
+        except Exception as e:
+            print(f"⚠️ Lỗi khi tạo thumbnail cho ảnh {image_id}: {e}")
+
+    @classmethod
+    def schedule_variants(cls, image):
+        """Sinh biến thể trong thread nền để không chặn request upload"""
+        return cls._executor.submit(cls.generate_variants, image.id, image.content_hash)
+
+    @classmethod
+    def get_or_create_variant(cls, image, width, fmt):
+        """Lấy biến thể đã cache, nếu chưa có thì sinh ngay (fallback cho ảnh cũ)"""
+        key = cls.variant_key(width, fmt)
+        variant = (image.variants or {}).get(key)
+        if variant and get_blob_storage().exists(variant["content_hash"]):
+            return variant
+
+        data = get_blob_storage().read(image.content_hash)
+        return cls._store(image.id, cls._render(data, [width], [fmt]))[key]
+
+    @staticmethod
+    def variant_hashes(image):
+        return [variant["content_hash"] for variant in (image.variants or {}).values()]
@@ -1,8 +1,19 @@
 # services/user_service.py
 from models.user import User
+from services.identity_service import IdentityService
+from services.stats_service import StatsService
+from services.pagination import paginate
+from services.text_search import query_tokens, prefix_pattern, username_key
+import re
 import datetime
+import os
 
 class UserService:
+    
+    # Số người dùng tối đa được chấm điểm cho một truy vấn tìm kiếm (truy vấn quá rộng như "n" không phải
+    # chấm điểm và sắp xếp một phần lớn collection)
+    SEARCH_MAX_CANDIDATES = int(os.getenv("USER_SEARCH_MAX_CANDIDATES", 1000))
+    
     @staticmethod
     def update_profile(user_id, data):
         """Cập nhật thông tin hồ sơ người dùng"""
@@ -59,8 +70,11 @@ class UserService:
         return user
     
     @staticmethod
-    def get_all_users(page=1, per_page=20, is_active=None, role=None):
-        """Lấy danh sách người dùng với phân trang, cho phép lọc theo is_active và role (chỉ admin)"""
+    def get_all_users(page=1, per_page=20, is_active=None, role=None, cursor=None, count='none'):
+        """
+        Lấy danh sách người dùng với phân trang (page hoặc cursor), cho phép lọc theo is_active và role (chỉ admin).
+        Trả về dict {'items': [User], ...thông tin phân trang}.
+        """
         query = {}
         
         # Nếu is_active không phải None, chuyển về boolean và đưa vào query
@@ -80,7 +94,8 @@ class UserService:
         # Lọc và phân trang
         # User.objects(**query) tương đương với User.objects.filter(**query) trong Django ORM
         # Ví dụ: User.objects(is_active=True, role="admin")
-        return User.objects(**query).paginate(page=page, per_page=per_page)
+        args = {'page': page, 'per_page': per_page, 'cursor': cursor, 'count': count}
+        return paginate(User.objects(**query).exclude('password'), args, raw=False, filtered=bool(query))
     
     @staticmethod
     def delete_user(user_id):
@@ -90,6 +105,8 @@ class UserService:
             raise ValueError("Không tìm thấy người dùng")
             
         user.delete()
+        IdentityService.invalidate(user_id)
+        StatsService.record_user(StatsService.user_state(user), None)
         return True
         
     @staticmethod
@@ -99,8 +116,11 @@ class UserService:
         if not user:
             raise ValueError("Không tìm thấy người dùng")
             
+        before = StatsService.user_state(user)
         user.is_active = is_active
         user.save()
+        IdentityService.invalidate(user_id)
+        StatsService.record_user(before, StatsService.user_state(user))
         return user
     
     @staticmethod
@@ -113,36 +133,88 @@ class UserService:
         if role not in ["user", "admin"]:
             raise ValueError("Vai trò không hợp lệ. Các vai trò hợp lệ: user, admin")
             
+        before = StatsService.user_state(user)
         user.role = role
         user.save()
+        IdentityService.invalidate(user_id)
+        StatsService.record_user(before, StatsService.user_state(user))
         return user
     
+    @staticmethod
+    def search_candidates(collection, query, max_candidates=None):
+        """
+        _id của các người dùng sẽ được chấm điểm cho truy vấn (dùng chung cho search_users và benchmark):
+        - người dùng có username bắt đầu bằng truy vấn (tra qua chỉ mục unique của username, luôn được giữ lại
+          để người dùng trùng username không bị loại khi từ khóa phổ biến như "nguyen" khớp rất nhiều người);
+        - tối đa max_candidates người dùng khớp khác qua search_keys (mỗi từ của truy vấn là tiền tố của một khóa).
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            raise ValueError("Từ khóa tìm kiếm không hợp lệ")
+        
+        limit = max_candidates or UserService.SEARCH_MAX_CANDIDATES
+        match = {'search_keys': {'$all': [re.compile(prefix_pattern(token)) for token in tokens]}}
+        # Regex neo đầu phân biệt hoa thường dùng được chỉ mục username: thử truy vấn gốc, chữ thường và đã bỏ dấu
+        variants = {query.strip(), query.strip().lower(), username_key(query)}
+        username_match = dict(match, username={'$in': [re.compile(prefix_pattern(v)) for v in variants if v]})
+        
+        ids = [doc['_id'] for doc in collection.find(username_match, {'_id': 1}).hint([('username', 1)]).limit(limit)]
+        seen = set(ids)
+        for doc in collection.find(match, {'_id': 1}).limit(limit):
+            if doc['_id'] not in seen:
+                seen.add(doc['_id'])
+                ids.append(doc['_id'])
+        return ids
+    
+    @staticmethod
+    def search_pipeline(query, candidate_ids, page=1, per_page=20):
+        """Aggregation chấm điểm và sắp xếp các ứng viên của search_candidates"""
+        tokens = query_tokens(query)
+        # Khóa đầu tiên của search_keys là username đã chuẩn hóa
+        username = {'$arrayElemAt': ['$search_keys', 0]}
+        exact = username_key(query)
+        first = prefix_pattern(tokens[0])
+        return [
+            {'$match': {'_id': {'$in': candidate_ids}}},
+            {'$addFields': {'score': {'$add': [
+                {'$cond': [{'$eq': [username, exact]}, 8, 0]},
+                {'$cond': [{'$regexMatch': {'input': username, 'regex': prefix_pattern(exact)}}, 4, 0]},
+                {'$size': {'$setIntersection': ['$search_keys', tokens]}},
+                {'$cond': [{'$regexMatch': {'input': {'$toLower': '$email'}, 'regex': first}}, 1, 0]}
+            ]}}},
+            {'$sort': {'score': -1, 'username': 1}},
+            {'$skip': (page - 1) * per_page},
+            {'$limit': per_page + 1},
+            {'$project': {'password': 0, 'search_keys': 0}}
+        ]
+    
     @staticmethod
     def search_users(query, page=1, per_page=20):
-        """Tìm kiếm người dùng theo tên hoặc email"""
-        users = User.objects(
-            __raw__={
-                "$or": [
-                    {"username": {"$regex": query, "$options": "i"}},
-                    {"email": {"$regex": query, "$options": "i"}},
-                    {"full_name": {"$regex": query, "$options": "i"}}
-                ]
-            }
-        ).paginate(page=page, per_page=per_page)
+        """
+        Tìm kiếm người dùng theo username, email hoặc họ tên (không phân biệt hoa thường và dấu).
+        Kết quả xếp theo mức độ liên quan: trùng username > username bắt đầu bằng truy vấn > trùng nguyên từ > email.
+        Người dùng có username bắt đầu bằng truy vấn luôn được xếp hạng; với truy vấn quá rộng, các người dùng khớp khác
+        chỉ được xếp hạng trong USER_SEARCH_MAX_CANDIDATES kết quả đầu tiên (xem search_candidates).
+        Trả về {'items': [dict], 'page', 'has_more'}.
+        """
+        collection = User._get_collection()
+        candidate_ids = UserService.search_candidates(collection, query)
+        docs = list(collection.aggregate(UserService.search_pipeline(query, candidate_ids, page, per_page)))
         
-        return users
+        return {
+            'items': docs[:per_page],
+            'page': page,
+            'has_more': len(docs) > per_page
+        }
     
     @staticmethod
     def get_user_stats():
-        """Lấy thống kê người dùng"""
-        total_users = User.objects.count()
-        active_users = User.objects(is_active=True).count()
-        inactive_users = User.objects(is_active=False).count()
-        admin_users = User.objects(role="admin").count()
+        """Lấy thống kê người dùng (từ bộ đếm lưu sẵn hoặc một aggregation, không đếm từng điều kiện)"""
+        stats = StatsService.get_stats()
         
         return {
-            "total_users": total_users,
-            "active_users": active_users,
-            "inactive_users": inactive_users,
-            "admin_users": admin_users
+            "total_users": stats['users'],
+            "active_users": stats['users_active'],
+            "inactive_users": stats['users_inactive'],
+            "admin_users": stats['users_admin']
         }
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Cho phép import các package của backend (services, models...) khi chạy pytest từ bất kỳ thư mục nào
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,102 @@
+# tests/test_bulk_caption_service.py
+import io
+import struct
+import zipfile
+
+import pytest
+
+pytest.importorskip("flask_mongoengine")
+
+from services.bulk_caption_service import BulkCaptionService  # noqa: E402
+from services.image_service import ImageService  # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+class Upload:
+    """Giống FileStorage của Werkzeug: chỉ cần filename và stream"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.stream = io.BytesIO(data)
+
+
+class StoredImage:
+    def __init__(self, name):
+        self.id = name
+        self.content_hash = name
+
+
+def make_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def mark_encrypted(data):
+    """Bật cờ mã hóa (bit 0) của mọi mục trong local header và central directory"""
+    data = bytearray(data)
+    for signature, offset in ((b"PK\x03\x04", 6), (b"PK\x01\x02", 8)):
+        start = data.find(signature)
+        while start != -1:
+            flags = struct.unpack_from("<H", data, start + offset)[0]
+            struct.pack_into("<H", data, start + offset, flags | 0x1)
+            start = data.find(signature, start + 4)
+    return bytes(data)
+
+
+def corrupt_deflate(data, name):
+    """Ghi đè phần dữ liệu nén của một mục để giải nén bị lỗi"""
+    data = bytearray(data)
+    with zipfile.ZipFile(io.BytesIO(bytes(data))) as archive:
+        info = archive.getinfo(name)
+    header = info.header_offset
+    name_length, extra_length = struct.unpack_from("<HH", data, header + 26)
+    start = header + 30 + name_length + extra_length
+    data[start:start + info.compress_size] = b"\xff" * info.compress_size
+    return bytes(data)
+
+
+@pytest.fixture
+def bulk(monkeypatch):
+    def store_image(stream, filename, description, user):
+        ImageService.sniff_mime_type(stream.read())
+        return StoredImage(filename)
+
+    monkeypatch.setattr(ImageService, "store_image", staticmethod(store_image))
+    monkeypatch.setattr(BulkCaptionService, "_caption", staticmethod(lambda image, params, speak: f"caption {image.id}"))
+
+    def run(files):
+        return list(BulkCaptionService.run(files, user=None, params={}, speak=False))
+    return run
+
+
+def test_encrypted_entry_reports_failure_and_summary(bulk):
+    archive = mark_encrypted(make_zip([("a.png", PNG), ("b.png", PNG)]))
+    results = bulk([Upload("album.zip", archive), Upload("c.png", PNG)])
+
+    summary = results[-1]
+    assert summary["done"] is True
+    assert summary == {"done": True, "total": 3, "succeeded": 1, "failed": 2, "skipped": 0}
+    failed = [r for r in results[:-1] if r["status"] == "failed"]
+    assert {r["file_name"] for r in failed} == {"a.png", "b.png"}
+
+
+def test_corrupt_deflate_entry_does_not_cut_stream(bulk):
+    archive = corrupt_deflate(make_zip([("a.png", PNG * 50), ("b.png", PNG)]), "a.png")
+    results = bulk([Upload("album.zip", archive)])
+
+    by_name = {r["file_name"]: r for r in results[:-1]}
+    assert by_name["a.png"]["status"] == "failed"
+    assert by_name["b.png"]["status"] == "done"
+    assert results[-1]["done"] is True
+
+
+def test_broken_archive_is_one_failed_line(bulk):
+    # Có chữ ký end-of-central-directory (is_zipfile đúng) nhưng central directory trỏ ra ngoài file
+    broken = b"garbage" + b"PK\x05\x06" + b"\x00" * 6 + struct.pack("<HHII", 1, 1, 46, 1000) + b"\x00\x00"
+    results = bulk([Upload("album.zip", broken), Upload("c.png", PNG)])
+
+    assert results[-1] == {"done": True, "total": 2, "succeeded": 1, "failed": 1, "skipped": 0}
@@ -0,0 +1,49 @@
+# tests/test_caption_batcher.py
+import threading
+
+from services.caption_batcher import CaptionBatcher
+
+
+def test_backlog_is_batched_after_deadline_passed():
+    """Các yêu cầu dồn lại trong lúc batch trước đang chạy phải được gom chung, không chạy từng cái một"""
+    started = threading.Event()
+    release = threading.Event()
+    sizes = []
+
+    def run_batch(payloads, **params):
+        sizes.append(len(payloads))
+        if len(sizes) == 1:
+            started.set()
+            release.wait(5)
+        return [f"caption {payload}" for payload in payloads]
+
+    batcher = CaptionBatcher(run_batch, max_batch_size=8, max_wait_ms=1)
+    first = batcher.submit(0)
+    assert started.wait(5)
+
+    # Hàng đợi được lấp đầy khi worker còn bận, hạn chờ của các yêu cầu này đã qua lúc worker rảnh
+    futures = [batcher.submit(i) for i in range(1, 17)]
+    threading.Event().wait(0.05)
+    release.set()
+
+    assert first.result(timeout=5) == "caption 0"
+    assert [future.result(timeout=5) for future in futures] == [f"caption {i}" for i in range(1, 17)]
+    assert sizes == [1, 8, 8]
+    assert batcher.metrics.snapshot()["batch_size_histogram"] == {"1": 1, "8": 2}
+
+
+def test_groups_by_params():
+    sizes = []
+    release = threading.Event()
+
+    def run_batch(payloads, **params):
+        sizes.append((params["num_beams"], len(payloads)))
+        release.wait(5)
+        return payloads
+
+    batcher = CaptionBatcher(run_batch, max_batch_size=8, max_wait_ms=1)
+    futures = [batcher.submit(i, num_beams=1 + i % 2) for i in range(5)]
+    release.set()
+
+    assert [future.result(timeout=5) for future in futures] == list(range(5))
+    assert sum(size for _, size in sizes) == 5